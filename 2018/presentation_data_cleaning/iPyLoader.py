@@ -17,14 +17,66 @@ Usage:
     # this works as well:
     from my_notebook import this_function
 
+    # lazy mode (see below)
+    iPyLoader.LAZY_CELLS = True
+    from my_notebook import this_function
+
+    # import several notebooks at once (see `preload`)
+    iPyLoader.preload(['my_notebook', 'my_other_notebook'])
+
+By default all code cells of a notebook are executed when it is imported. In lazy
+mode (`LAZY_CELLS = True`) the cells are split into their top-level statements and only
+imports, function definitions and the statements they need are executed right away
+(in the order of the notebook). A statement is needed if it binds a name that one of
+these statements reads, e.g. a global variable used in a function or a default value
+of an argument. The other statements (including class definitions since their body runs
+at definition time) are deferred: when an attribute of the module that one of them
+defines is accessed for the first time, the deferred statements are executed in order
+up to the last one binding this attribute.
+
+The code cells of imported notebooks are transformed (IPython syntax such as magics
+to Python code) and compiled once. The result is cached in a "__pycache__" folder
+next to the notebook (the same way Python caches the bytecode of .py modules) and
+reused as long as the notebook and the version of IPython do not change.
+
+Since the finder is on `sys.meta_path`, it is asked about every import that the
+default finders could not resolve. To keep this cheap, the content of each directory
+of `sys.path` is listed once and cached until the directory changes (like the
+`FileFinder` of importlib). Call `importlib.invalidate_caches()` if a notebook is
+created and not found.
+
 """
 
-import io, os, sys, types
+import ast, io, os, sys, time
+import dis, graphlib, importlib, importlib.abc, importlib.util, marshal, tempfile
+from concurrent.futures import ThreadPoolExecutor
+import IPython
 from IPython import get_ipython
 from nbformat import read
 from IPython.core.interactiveshell import InteractiveShell
 
 
+# cache of the content of directories {directory: (modification time, filenames)}
+_directory_listings = {}
+
+def list_directory(d):
+    """returns the filenames in a directory, the listing is cached as long as
+    the modification time of the directory does not change
+    """
+    try:
+        mtime = os.stat(d or '.').st_mtime_ns
+    except (OSError, TypeError, ValueError):  # e.g. a directory that does not exist
+        return frozenset()
+    listing = _directory_listings.get(d)
+    if listing is not None and listing[0] == mtime:
+        return listing[1]
+    try:
+        filenames = frozenset(os.listdir(d or '.'))
+    except OSError:  # e.g. a zip file in sys.path
+        filenames = frozenset()
+    _directory_listings[d] = (mtime, filenames)
+    return filenames
+
 def find_notebook(fullname, path=None):
     """find a notebook, given its fully qualified name and an optional path
 
@@ -35,66 +87,258 @@ def find_notebook(fullname, path=None):
     name = fullname.rsplit('.', 1)[-1]
     if not path:
         path = sys.path # Edited this here rather than using current directory
+    filename = name + ".ipynb"
     for d in path:
-        nb_path = os.path.join(d, name + ".ipynb")
-        if os.path.isfile(nb_path):
-            return nb_path
+        filenames = list_directory(d)
+        if filename in filenames:
+            return os.path.join(d, filename)
         # let import Notebook_Name find "Notebook Name.ipynb"
-        nb_path = nb_path.replace("_", " ")
-        if os.path.isfile(nb_path):
-            return nb_path
+        if filename.replace("_", " ") in filenames:
+            return os.path.join(d, filename.replace("_", " "))
+
+# see the docstring of the module
+LAZY_CELLS = False
+
+# change this when the content of the cache changes
+CACHE_FORMAT = 3
+
+# code cells compiled by `preload` waiting to be executed {(path, modification time, size): cells}
+_preloaded_cells = {}
+
+def _preload_key(nb_path, nb_stat):
+    # `find_notebook` may return relative paths (e.g. when "" is in sys.path) whereas
+    # the import system gives absolute ones to the loader
+    return (os.path.realpath(nb_path), nb_stat.st_mtime_ns, nb_stat.st_size)
+
+def cache_path(nb_path):
+    """path of the cache of the compiled code cells of a notebook
+
+    e.g. "A:/my_directory/__pycache__/my_notebook.ipynb.ipython-8.12.3.cache"
+    """
+    directory, filename = os.path.split(nb_path)
+    return os.path.join(directory, '__pycache__', f'{filename}.ipython-{IPython.__version__}.cache')
+
+def _cache_header(nb_stat):
+    # the cache is only valid for the same notebook (modification time and size) and the same
+    # version of Python (code objects of different versions are not compatible)
+    return (CACHE_FORMAT, importlib.util.MAGIC_NUMBER, nb_stat.st_mtime_ns, nb_stat.st_size)
+
+def bound_names(tree):
+    """returns the names that the top-level statements of a parsed cell bind in the module"""
+    return _scope_names(tree.body)
+
+def _scope_names(nodes):
+    # names bound directly in a scope (names bound in nested scopes are left out)
+    names = set()
+    nodes = list(nodes)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split('.')[0] for alias in node.names if alias.name != '*')
+        elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            continue  # they have their own scope
+        else:
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                names.add(node.id)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                names.add(node.name)
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+def free_names(node):
+    """returns the names of the module that a top-level statement reads, when it runs or
+    later on when the functions it defines are called
+    """
+    return _free_names([node], local_names=frozenset(), closure_names=frozenset())
+
+def _free_names(nodes, local_names, closure_names):
+    # `local_names` are visible in the current scope and `closure_names` in the functions
+    # defined in this scope (they differ in class bodies)
+    names = set()
+    nodes = list(nodes)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            arguments = node.args
+            parameters = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+            parameters += [arg for arg in (arguments.vararg, arguments.kwarg) if arg is not None]
+            # evaluated when the function is defined
+            nodes.extend(arguments.defaults + [default for default in arguments.kw_defaults if default is not None])
+            nodes.extend(parameter.annotation for parameter in parameters if parameter.annotation is not None)
+            if not isinstance(node, ast.Lambda):
+                nodes.extend(node.decorator_list + ([node.returns] if node.returns is not None else []))
+            # evaluated when the function is called
+            body = node.body if isinstance(node.body, list) else [node.body]
+            global_names = {name for child in ast.walk(node) if isinstance(child, ast.Global) for name in child.names}
+            function_names = closure_names | {parameter.arg for parameter in parameters} | _scope_names(body)
+            function_names -= global_names
+            names |= _free_names(body, local_names=function_names, closure_names=function_names)
+        elif isinstance(node, ast.ClassDef):
+            nodes.extend(node.bases + [keyword.value for keyword in node.keywords] + node.decorator_list)
+            names |= _free_names(node.body, local_names=local_names | _scope_names(node.body),
+                                 closure_names=closure_names)
+        elif isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            targets = _scope_names(generator.target for generator in node.generators)
+            names |= _free_names(ast.iter_child_nodes(node), local_names=local_names | targets,
+                                 closure_names=closure_names | targets)
+        else:
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in local_names:
+                names.add(node.id)
+            nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+def is_definition(node):
+    """whether a parsed top-level statement is an import, a function definition or a docstring"""
+    definitions = (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef)
+    return isinstance(node, definitions) or (isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant))
 
-class NotebookLoader(object):
+def plan_lazy_execution(statements):
+    """returns for each statement of `get_code_cells` whether it must be executed right away
+    in lazy mode (see the docstring of the module)
+    """
+    eager = [is_definition for _, is_definition, _, _ in statements]
+    # statements binding names read by eager statements are needed by them, and so on.
+    # Statements binding the same names as eager statements are executed as well so that
+    # these names end up with the same values as when all the cells are executed
+    changed = True
+    while changed:
+        changed = False
+        needed = set()
+        for (_, _, bound, free), is_eager in zip(statements, eager):
+            if is_eager:
+                needed.update(bound, free)
+        for ix, (_, _, bound, _) in enumerate(statements):
+            if not eager[ix] and needed.intersection(bound):
+                eager[ix] = changed = True
+    return eager
+
+def read_cache(nb_path, nb_stat):
+    """returns the cached code cells of a notebook or None if there is no valid cache"""
+    try:
+        with open(cache_path(nb_path), 'rb') as f:
+            header, codes = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if header != _cache_header(nb_stat):
+        return None
+    return codes
+
+def write_cache(nb_path, nb_stat, codes):
+    """caches the code cells of a notebook (errors are ignored like when Python writes bytecode)"""
+    if sys.dont_write_bytecode:
+        return
+    path = cache_path(nb_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so that other processes never read a partial cache
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump((_cache_header(nb_stat), codes), f)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+class NotebookLoader(importlib.abc.Loader):
     """Module Loader for Jupyter Notebooks"""
     def __init__(self, path=None):
         self.shell = InteractiveShell.instance()
         self.path = path
 
-    def load_module(self, fullname):
-        """import a notebook as a module"""
-        path = find_notebook(fullname, self.path)
-
-        print ("importing Jupyter notebook from %s" % path)
+    def get_code_cells(self, path):
+        """returns the code cells of a notebook split into compiled top-level statements (from the
+        cache if it is up to date) as a list of tuples (code object, whether it is a definition,
+        names bound by the statement, names read by the statement)
+        """
+        nb_stat = os.stat(path)
+        codes = _preloaded_cells.pop(_preload_key(path, nb_stat), None)
+        if codes is None:
+            codes = read_cache(path, nb_stat)
+        if codes is not None:
+            return codes
 
         # load the notebook object
         with io.open(path, 'r', encoding='utf-8') as f:
             nb = read(f, 4)
 
+        codes = []
+        for ix, cell in enumerate(nb.cells):
+            if cell.cell_type == 'code':
+                # transform the input to executable Python
+                code = self.shell.input_transformer_manager.transform_cell(cell.source)
+                for node in ast.parse(code).body:
+                    statement = ast.Module(body=[node], type_ignores=[])
+                    codes.append((compile(statement, f'<{path} cell {ix}>', 'exec'), is_definition(node),
+                                  tuple(sorted(bound_names(statement))), tuple(sorted(free_names(node)))))
+        write_cache(path, nb_stat, codes)
+        return codes
+
+    def create_module(self, spec):
+        # use the default module creation
+        return None
+
+    def exec_module(self, mod):
+        """run a notebook in the namespace of a module (the module is created
+        and added to sys.modules by the import system beforehand)
+        """
+        path = mod.__spec__.origin
+
+        print ("importing Jupyter notebook from %s" % path)
+
+        statements = self.get_code_cells(path)
 
-        # create the module and add it to sys.modules
-        # if name in sys.modules:
-        #    return sys.modules[name]
-        mod = types.ModuleType(fullname)
-        mod.__file__ = path
-        mod.__loader__ = self
         mod.__dict__['get_ipython'] = get_ipython
-        sys.modules[fullname] = mod
 
+        if not LAZY_CELLS:
+            self.exec_cells(mod, [code for code, _, _, _ in statements])
+            return
+
+        eager = plan_lazy_execution(statements)
+        deferred_statements = [statement for statement, is_eager in zip(statements, eager) if not is_eager]
+        deferred_names = {name for _, _, names, _ in deferred_statements for name in names}
+        self.exec_cells(mod, [code for (code, _, _, _), is_eager in zip(statements, eager) if is_eager])
+
+        def __getattr__(name):
+            # run the deferred statements in order until the last one binding `name`
+            if name in deferred_names:
+                while any(name in names for _, _, names, _ in deferred_statements):
+                    code, _, _, _ = deferred_statements.pop(0)
+                    self.exec_cells(mod, [code])
+            try:
+                return mod.__dict__[name]
+            except KeyError:
+                raise AttributeError(f"module {mod.__name__!r} has no attribute {name!r}") from None
+
+        def __dir__():
+            return sorted(set(mod.__dict__) | deferred_names)
+
+        mod.__getattr__ = __getattr__
+        mod.__dir__ = __dir__
+
+    def exec_cells(self, mod, codes):
+        """run compiled code cells in the namespace of a module"""
         # extra work to ensure that magics that would affect the user_ns
         # actually affect the notebook module's ns
         save_user_ns = self.shell.user_ns
         self.shell.user_ns = mod.__dict__
 
         try:
-          for cell in nb.cells:
-            if cell.cell_type == 'code':
-                # transform the input to executable Python
-                code = self.shell.input_transformer_manager.transform_cell(cell.source)
-                # run the code in themodule
-                exec(code, mod.__dict__)
+          for code in codes:
+            # run the code in themodule
+            exec(code, mod.__dict__)
         finally:
             self.shell.user_ns = save_user_ns
-        return mod
 
-class NotebookFinder(object):
+class NotebookFinder(importlib.abc.MetaPathFinder):
     """Module finder that locates Jupyter Notebooks"""
     def __init__(self):
         self.loaders = {}
 
-    def find_module(self, fullname, path=None):
+    def find_spec(self, fullname, path=None, target=None):
         nb_path = find_notebook(fullname, path)
         if not nb_path:
-            return
+            return None
 
         key = path
         if path:
@@ -103,6 +347,61 @@ class NotebookFinder(object):
 
         if key not in self.loaders:
             self.loaders[key] = NotebookLoader(path)
-        return self.loaders[key]
+        return importlib.util.spec_from_file_location(fullname, nb_path, loader=self.loaders[key])
+
+    def invalidate_caches(self):
+        _directory_listings.clear()
 
 sys.meta_path.append(NotebookFinder())
+
+
+def imported_modules(cells):
+    """returns the names of the modules that code cells import when they run
+    (imports inside of functions are not included)
+    """
+    return {instruction.argval for code, _, _, _ in cells for instruction in dis.get_instructions(code)
+            if instruction.opname == 'IMPORT_NAME'}
+
+def preload(names, max_workers=None):
+    """import several notebooks at once
+
+    The code cells of the notebooks are parsed, transformed and compiled concurrently
+    in a pool of threads (unless they are cached already, see the docstring of the module).
+    Then the notebooks are executed in the order of their dependencies (notebooks importing
+    one another) so that the time spent executing each notebook does not include its
+    dependencies.
+
+    Returns the time in seconds spent compiling and executing each notebook
+    {name: (compile time, execution time)} (it is printed as well).
+    """
+    names = [name for name in names if name not in sys.modules]
+    paths = {}
+    for name in names:
+        paths[name] = find_notebook(name)
+        if not paths[name]:
+            raise ModuleNotFoundError(f'No notebook named {name!r}', name=name)
+
+    loader = NotebookLoader()
+    def compile_notebook(name):
+        start = time.perf_counter()
+        nb_stat = os.stat(paths[name])
+        cells = loader.get_code_cells(paths[name])
+        _preloaded_cells[_preload_key(paths[name], nb_stat)] = cells
+        return cells, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        compiled = dict(zip(names, executor.map(compile_notebook, names)))
+
+    # {name: notebooks it depends on}
+    graph = {}
+    for name, (cells, _) in compiled.items():
+        modules = imported_modules(cells)
+        graph[name] = [other for other in names if other != name and other in modules]
+
+    timings = {}
+    for name in graphlib.TopologicalSorter(graph).static_order():
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = (compiled[name][1], time.perf_counter() - start)
+        print("%s: compiled in %.3fs, executed in %.3fs" % (name, *timings[name]))
+    return timings
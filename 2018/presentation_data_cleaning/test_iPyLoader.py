@@ -0,0 +1,101 @@
+"""Checks that the notebooks of this folder can be imported with iPyLoader (run with pytest
+from this folder)."""
+
+import datetime, sys
+
+import pandas as pd
+import pytest
+
+import iPyLoader
+
+
+NOTEBOOKS = ['Export_client', 'Gender_Names', 'Interpolation', 'Randomizer', 'Timedelta', 'Value_counts']
+
+@pytest.fixture
+def import_notebook(monkeypatch):
+    """imports a notebook again in lazy mode"""
+    monkeypatch.setattr(iPyLoader, 'LAZY_CELLS', True)
+    def import_notebook(name):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+        return __import__(name)
+    yield import_notebook
+    for name in NOTEBOOKS:
+        sys.modules.pop(name, None)
+
+def test_lazy_statements(import_notebook, tmp_path, monkeypatch):
+    nbformat = pytest.importorskip('nbformat')
+    nb = nbformat.v4.new_notebook(cells=[
+        nbformat.v4.new_code_cell('import math\nregistry = []\nslow = math.factorial(5)'),
+        nbformat.v4.new_code_cell('def register(f):\n    registry.append(f.__name__)\n    return f'),
+        nbformat.v4.new_code_cell('@register\ndef double(x, factor=math.pi):\n    return 2 * x\nregistry.append("end")'),
+    ])
+    nbformat.write(nb, str(tmp_path / 'lazy_statements.ipynb'))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    lazy_statements = import_notebook('lazy_statements')
+    try:
+        # `registry` is needed by `register` but the last statement of the notebook is deferred
+        assert lazy_statements.registry == ['double']
+        assert 'slow' not in vars(lazy_statements)
+        assert lazy_statements.slow == 120
+        assert lazy_statements.double(2) == 4
+    finally:
+        sys.modules.pop('lazy_statements', None)
+
+def test_lazy_export_client(import_notebook):
+    Export_client = import_notebook('Export_client')
+    df = pd.DataFrame({'a': [1, 2], 'b': [3, 4]})
+    df_export = Export_client.multi_index_export(df, initial_columns=['a'])
+    assert list(df_export.columns) == [('Originale Spalten', 'a'), ('Tripicchio Spalten', 'b')]
+
+def test_lazy_gender_names(import_notebook):
+    pytest.importorskip('gender_guesser')
+    Gender_Names = import_notebook('Gender_Names')
+    # the functions use global variables of the notebook
+    assert Gender_Names.get_genders_from_first_names(pd.Series(['Anna', 'Peter'])).tolist() == ['Frau', 'Mann']
+
+def test_lazy_interpolation(import_notebook):
+    Interpolation = import_notebook('Interpolation')
+    # the example runs at definition time so it is deferred
+    assert 'interpolation_example' not in vars(Interpolation)
+    assert 'interpolation_example' in dir(Interpolation)
+    if int(pd.__version__.split('.')[0]) >= 2:
+        pytest.skip('the notebook uses `GroupBy.sum(axis=...)` which was removed in pandas 2')
+    values = Interpolation.interpolation_from_other_rows(pd.Series(['Paris', 'Paris']), pd.Series(['Frankreich', None]))
+    assert values.tolist() == ['Frankreich', 'Frankreich']
+
+def test_lazy_randomizer(import_notebook):
+    pytest.importorskip('faker')
+    Randomizer = import_notebook('Randomizer')
+    assert 'fake' not in vars(Randomizer)
+    assert Randomizer.shuffle_series(pd.Series(['a', 'b', 'c']), stays_same=['a', 'b', 'c']).tolist() == ['a', 'b', 'c']
+    assert Randomizer.scramble_phone_numbers('abc') == 'abc'
+    # the deferred statement runs when it is needed
+    assert Randomizer.fake.name()
+
+def test_lazy_timedelta(import_notebook):
+    Timedelta = import_notebook('Timedelta')
+    series_str, _ = Timedelta.timedelta(pd.Series(pd.to_datetime(['2020-01-01'])), 'day', 'day', 'days',
+                                         compare_datetime=datetime.datetime(2020, 1, 3))
+    assert series_str.tolist() == ['2 days']
+
+def test_lazy_value_counts(import_notebook):
+    Value_counts = import_notebook('Value_counts')
+    df = Value_counts.value_counts_df(pd.DataFrame({'a': ['x', 'x', None]}))
+    assert df['a'].tolist() == ['x (2)', '*Keine Angabe (Null)* (1)']
+
+def test_preload_relative_path(monkeypatch):
+    # find_notebook returns relative paths when "" is in sys.path
+    monkeypatch.chdir(iPyLoader.os.path.dirname(iPyLoader.__file__))
+    monkeypatch.syspath_prepend('')
+    names = ['Export_client', 'Timedelta']
+    for name in names:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    monkeypatch.setattr(iPyLoader, '_preloaded_cells', {})
+    try:
+        iPyLoader.preload(names)
+        # the preloaded cells were used by the import
+        assert iPyLoader._preloaded_cells == {}
+        assert all(name in sys.modules for name in names)
+    finally:
+        for name in names:
+            sys.modules.pop(name, None)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# +
+"""
+Microbenchmark of the serialization of the example apps with and without
+FASTAPI_FAST_JSON=1 (see fast_json.py) for simple_fastapi.py and sql_fastapi.py.
+
+The apps are started with uvicorn (once with each setting) and load tested
+(see load_test.py) on the endpoints "/catalog/add" of simple_fastapi.py and
+"/catalog/{name}" of sql_fastapi.py. The SQL app uses a temporary SQLite database
+and its cache is disabled so that every request serializes a row of the database.
+
+Usage:
+$ pip install uvicorn httpx orjson
+$ python benchmark_json.py -n 5000 -c 50
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from plumbum import cli
+from loguru import logger
+try:
+    import httpx
+except (ModuleNotFoundError, ImportError) as e:
+    raise ModuleNotFoundError('Optional dependency `httpx` needs to be installed for the benchmark') from e
+
+from load_test import format_results, run_load_test
+# -
+
+# # Helpers
+
+# +
+PRODUCT = {'name': 'banana', 'price_per_unit': 0.5, 'quantity': 100,
+           'attributes': {'color': 'yellow', 'origin': 'Guadeloupe', 'organic': True}}
+
+def start_app(app, port, env):
+    """
+    Starts an app with uvicorn (e.g. app="simple_fastapi:app") in another process and
+    waits until it responds.
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', app, '--port', str(port), '--log-level', 'warning'],
+                               env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{app} stopped with the return code {process.returncode}')
+        try:
+            httpx.get(f'http://localhost:{port}/docs')
+            return process
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError(f'{app} did not start within 30s')
+# -
+
+# # Create CLI
+
+class JSONBenchmark(cli.Application):
+    """
+    Compares the requests/s of the example apps with and without FASTAPI_FAST_JSON=1.
+    """
+    requests = cli.SwitchAttr(['n', 'requests'], int, default=2000,
+                              help='Number of requests sent to each endpoint')
+    concurrency = cli.SwitchAttr(['c', 'concurrency'], int, default=20,
+                                 help='Number of requests in flight at any time')
+    port = cli.SwitchAttr(['p', 'port'], int, default=8700,
+                          help='Port of the first app (the next port is used as well)')
+
+    def main(self):
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for fast_json in ('0', '1'):
+                env = dict(os.environ, FASTAPI_FAST_JSON=fast_json, CATALOG_SCHEMA='', CATALOG_CACHE_SIZE='0',
+                           CATALOG_DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'catalog.db')}")
+                logger.info(f'Benchmarking with FASTAPI_FAST_JSON={fast_json}')
+                processes = [start_app('simple_fastapi:app', self.port, env),
+                             start_app('sql_fastapi:app', self.port + 1, env)]
+                try:
+                    # upsert so that the product can be added in both runs
+                    httpx.post(f'http://localhost:{self.port + 1}/catalog/bulk', json=[PRODUCT]).raise_for_status()
+                    for url, body in ((f'http://localhost:{self.port}/catalog/add', json.dumps(PRODUCT)),
+                                      (f'http://localhost:{self.port + 1}/catalog/banana', None)):
+                        result = asyncio.run(run_load_test(url, nb_requests=self.requests,
+                                                           concurrency=self.concurrency, body=body))
+                        results.append(result._replace(url=f'fast_json={fast_json} {url}'))
+                finally:
+                    for process in processes:
+                        process.terminate()
+                        process.wait()
+        print(format_results(results))
+
+
+# # Run CLI
+#
+# Only if this file is not imported as a module but run directly.
+
+if __name__ == "__main__":
+    JSONBenchmark.run()
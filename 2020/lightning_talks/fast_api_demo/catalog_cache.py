@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+# +
+"""
+Read-through cache for the products of the example app with SQL (see sql_fastapi.py).
+
+Products are cached as JSON bytes so that a cached response can be sent as is (without
+converting an ORM object to JSON on every request). Entries expire after a while (TTL)
+and the least recently used ones are dropped when the cache is full. The app removes the
+entry of a product whenever it writes this product.
+
+By default the cache lives in the process of the app. It can be shared between several
+processes or servers using Redis (`pip install redis`).
+
+The cache can be configured with environment variables:
+* CATALOG_CACHE_SIZE: maximum number of products in the in-process cache (default 10000, 0 disables the cache)
+* CATALOG_CACHE_TTL: number of seconds after which a cached product expires (default 60)
+* CATALOG_CACHE_REDIS_URL: e.g. "redis://localhost:6379/0" for using Redis instead of the in-process cache
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+# -
+
+# # Cache backends
+#
+# They have the same methods: `get`, `set`, `delete`, `clear` and `__len__` and the attribute `blocking`
+# (whether the methods wait for the network, they are then called in a thread by the async methods
+# of `ReadThroughCache` so that they do not block the event loop).
+
+# +
+class LRUCache:
+    """
+    In-process cache with a maximum number of entries (the least recently used
+    entries are dropped first) and a time to live in seconds.
+    """
+    blocking = False
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        # {key: (expiration time, value)}, the most recently used entries are at the end
+        self._entries = OrderedDict()
+        # the endpoints of sql_fastapi.py run in a threadpool
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    Cache in Redis that can be shared by several processes. Keys are prefixed
+    with `prefix` and expire after `ttl` seconds (Redis drops the least recently
+    used keys if it is configured with a "maxmemory-policy" such as "allkeys-lru").
+    """
+    blocking = True
+
+    def __init__(self, url, ttl=60, prefix='catalog:'):
+        try:
+            import redis
+        except (ModuleNotFoundError, ImportError) as e:
+            raise ModuleNotFoundError('Optional dependency `redis` needs to be installed for using Redis as a cache') from e
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+# -
+
+# # Read-through cache
+
+# +
+class ReadThroughCache:
+    """
+    Gets values from a backend (see above) and loads the missing ones with a function
+    given by the caller. Counts hits and misses.
+
+    A value that is being loaded while its key is invalidated (e.g. read from the database
+    just before the product was written) is not cached, otherwise the stale value would stay
+    in the cache until it expires. For this, each key being loaded has a generation that
+    `invalidate` increments. Note that this only covers the loads of the current process.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # {key: [generation, number of loads in progress]} of the keys being loaded
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        # returns the cached value (or None) and the generation of the key if it needs to be loaded
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                return value, None
+            self.misses += 1
+            load = self._loads.setdefault(key, [0, 0])
+            load[1] += 1
+            return None, load[0]
+
+    def _loaded(self, key, generation, value):
+        # caches a loaded value (`value` is None if loading failed) unless the key was invalidated meanwhile.
+        # The backend is called without holding the lock (it may be a network round trip with Redis)
+        with self._lock:
+            store = value is not None and self._loads[key][0] == generation
+        if store:
+            self.backend.set(key, value)
+        with self._lock:
+            load = self._loads[key]
+            # `invalidate` may have run while we were writing the value
+            stale = store and load[0] != generation
+            load[1] -= 1
+            if not load[1]:
+                del self._loads[key]
+        if stale:
+            self.backend.delete(key)
+
+    def get_or_load(self, key, load):
+        """
+        Returns the cached value of `key` or calls `load()` and caches the value it returns
+        (it must be bytes).
+        """
+        value, generation = self._get(key)
+        if value is not None:
+            return value
+        try:
+            value = load()
+        finally:
+            self._loaded(key, generation, value)
+        return value
+
+    async def _run_async(self, function, *args):
+        # calls a method using the backend in a thread if the backend is blocking (e.g. Redis)
+        if self.backend.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def get_or_load_async(self, key, load):
+        """
+        Same as `get_or_load` for a coroutine function `load` (e.g. a query with an async engine).
+        """
+        value, generation = await self._run_async(self._get, key)
+        if value is not None:
+            return value
+        try:
+            value = await load()
+        finally:
+            await self._run_async(self._loaded, key, generation, value)
+        return value
+
+    def invalidate(self, *keys):
+        """
+        Removes keys from the cache (call this after writing the corresponding rows).
+        """
+        with self._lock:
+            for key in keys:
+                if key in self._loads:
+                    self._loads[key][0] += 1
+        # the loads that already wrote their value delete it again (see `_loaded`)
+        for key in keys:
+            self.backend.delete(key)
+
+    async def invalidate_async(self, *keys):
+        """
+        Same as `invalidate` for coroutines.
+        """
+        await self._run_async(self.invalidate, *keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'backend': type(self.backend).__name__,
+                'size': len(self.backend),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None}
+
+def make_cache():
+    """
+    Creates a read-through cache using the environment variables described in the
+    docstring of this module.
+    """
+    ttl = float(os.environ.get('CATALOG_CACHE_TTL', 60))
+    redis_url = os.environ.get('CATALOG_CACHE_REDIS_URL')
+    if redis_url:
+        # Redis wants an integer for the expiration
+        return ReadThroughCache(RedisCache(redis_url, ttl=max(1, round(ttl))))
+    return ReadThroughCache(LRUCache(max_size=int(os.environ.get('CATALOG_CACHE_SIZE', 10000)), ttl=ttl))
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# +
+"""
+Fast JSON serialization shared by the example apps (see simple_fastapi.py and sql_fastapi.py).
+
+Set the environment variable FASTAPI_FAST_JSON=1 to serialize the responses with the library
+"orjson" (`pip install orjson`) which is a lot faster than the json module of Python. The apps
+then use `FastJSONResponse` as their default response class and their endpoints return it
+directly (see `json_response`) so that fastapi skips the conversion of their result
+(`jsonable_encoder`). Without the variable the apps behave like regular fastapi apps.
+
+See benchmark_json.py for a comparison.
+"""
+import json
+import os
+from fastapi import Response
+from fastapi.responses import JSONResponse
+# -
+
+# +
+FAST_JSON = os.environ.get('FASTAPI_FAST_JSON') == '1'
+
+if FAST_JSON:
+    try:
+        import orjson
+    except (ModuleNotFoundError, ImportError) as e:
+        raise ModuleNotFoundError('Optional dependency `orjson` needs to be installed for FASTAPI_FAST_JSON=1') from e
+    json_dumps = orjson.dumps
+else:
+    def json_dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class FastJSONResponse(Response):
+    """
+    JSON response serialized with `json_dumps`.
+    """
+    media_type = 'application/json'
+
+    def render(self, content):
+        return json_dumps(content)
+
+# default response class of the apps
+DefaultResponse = FastJSONResponse if FAST_JSON else JSONResponse
+
+def json_response(content):
+    """
+    Returns `content` as a `FastJSONResponse` with FASTAPI_FAST_JSON=1 or else as is
+    (fastapi converts and serializes it as usual).
+    """
+    return FastJSONResponse(content) if FAST_JSON else content
+# -
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# +
+"""
+Load test for the example apps: sends requests concurrently to one or several URLs
+(one URL after the other) and compares the throughput (requests/s) and the latencies.
+
+Usage (e.g. comparing the sync and the async app):
+$ pip install httpx
+$ uvicorn sql_fastapi:app --port 8000
+$ uvicorn sql_fastapi_async:app --port 8001
+$ python load_test.py http://localhost:8000/catalog/banana http://localhost:8001/catalog/banana -n 5000 -c 100
+"""
+import asyncio
+import statistics
+import time
+from collections import namedtuple
+from plumbum import cli
+from loguru import logger
+# -
+
+# # Run a load test
+
+# +
+LoadTestResult = namedtuple('LoadTestResult', ['url', 'requests', 'errors', 'duration', 'latencies'])
+
+async def run_load_test(url, nb_requests=1000, concurrency=50, body=None, warmup=10):
+    """
+    Sends `nb_requests` requests to `url` with `concurrency` requests in flight at any time.
+    The requests are GET requests unless a JSON `body` (str) is given in which case they are POST requests.
+
+    `warmup` requests are sent beforehand and not measured (e.g. to open the connections).
+    """
+    try:
+        import httpx
+    except (ModuleNotFoundError, ImportError) as e:
+        raise ModuleNotFoundError('Optional dependency `httpx` needs to be installed for load testing') from e
+
+    latencies = []
+    errors = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def send():
+            if body is None:
+                return await client.get(url)
+            return await client.post(url, content=body, headers={'content-type': 'application/json'})
+
+        async def worker(requests):
+            nonlocal errors
+            # all workers share the same iterator so that there are exactly `nb_requests` requests
+            for _ in requests:
+                start = time.perf_counter()
+                try:
+                    response = await send()
+                    errors += response.status_code >= 400
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        warmup_requests = iter(range(warmup))
+        await asyncio.gather(*(worker(warmup_requests) for _ in range(min(warmup, concurrency))))
+        latencies.clear()
+        errors = 0
+
+        requests = iter(range(nb_requests))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(requests) for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    return LoadTestResult(url=url, requests=nb_requests, errors=errors, duration=duration, latencies=latencies)
+
+def format_results(results):
+    """
+    Formats results of load tests as a table with the requests/s and the latency percentiles in ms.
+    """
+    lines = [f"{'url':<50} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7}"]
+    for result in results:
+        # 99 cut points, the nth is the nth percentile
+        percentiles = statistics.quantiles(result.latencies, n=100) if len(result.latencies) > 1 else result.latencies * 99
+        lines.append(f'{result.url:<50} {result.requests / result.duration:>9.1f} '
+                     f'{percentiles[49] * 1000:>8.1f} {percentiles[89] * 1000:>8.1f} {percentiles[98] * 1000:>8.1f} '
+                     f'{result.errors:>7}')
+    return '\n'.join(lines)
+# -
+
+# # Create CLI
+
+class LoadTest(cli.Application):
+    """
+    Sends requests concurrently to one or several URLs and compares their throughput
+    and latencies.
+    """
+    requests = cli.SwitchAttr(['n', 'requests'], int, default=1000,
+                              help='Number of requests sent to each URL')
+    concurrency = cli.SwitchAttr(['c', 'concurrency'], int, default=50,
+                                 help='Number of requests in flight at any time')
+    data = cli.SwitchAttr(['d', 'data'], str, default=None,
+                          help='JSON body to POST (GET requests are sent if this is not given)')
+    warmup = cli.SwitchAttr(['warmup'], int, default=10,
+                            help='Number of requests sent to each URL before measuring')
+
+    def main(self, *urls):
+        if not urls:
+            raise ValueError('At least one URL must be given')
+        results = []
+        for url in urls:
+            logger.info(f'Sending {self.requests} requests to {url} ({self.concurrency} at a time)')
+            results.append(asyncio.run(run_load_test(url, nb_requests=self.requests, concurrency=self.concurrency,
+                                                     body=self.data, warmup=self.warmup)))
+        print(format_results(results))
+
+
+# # Run CLI
+#
+# Only if this file is not imported as a module but run directly.
+
+if __name__ == "__main__":
+    LoadTest.run()
@@ -10,11 +10,15 @@ $ pip install uvicorn
 $ uvicorn simple_fastapi:app --reload
 * deploying
 $ uvicorn simple_fastapi:app --host 0.0.0.0 --port 80
+
+Responses are serialized faster with FASTAPI_FAST_JSON=1, see fast_json.py.
 """
 from typing import Optional
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from fast_json import DefaultResponse, json_response
+
 
 # # JSON Models for the API
 
@@ -30,14 +34,14 @@ class Product(BaseModel):
 # # Create the API
 
 # +
-app = FastAPI()
+app = FastAPI(default_response_class=DefaultResponse)
 
 @app.get("/")
 def read_root(name: Optional[str]="world"):
     """
     Greets a user of the API.
     """
-    return f"Hello {name}"
+    return json_response(f"Hello {name}")
 
 @app.post("/catalog/add")
 def add_item(product: Product):
@@ -48,4 +52,6 @@ def add_item(product: Product):
     # see sql_fastapi.py for an example with a database
 
     # here we will just send a message pretending we added the product
-    return f'A product has been added: {product.dict()}'
+    # dict(product) gives the same result as product.dict() for formatting without converting
+    # the fields recursively
+    return json_response(f'A product has been added: {dict(product)}')
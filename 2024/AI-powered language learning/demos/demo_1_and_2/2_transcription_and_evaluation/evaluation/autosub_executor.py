@@ -0,0 +1,239 @@
+"""
+Runs several `autosub` processes at once for transcribing clips (see `2_transcribe.ipynb`).
+
+Instead of `poetry run autosub ...` for every clip (poetry takes a while to find its environment
+each time), the executable of autosub is looked up once. Each worker thread writes the outputs
+of autosub in its own temporary directory. Runs that time out or fail are retried.
+
+Benchmark against the sequential `poetry run autosub` (clips per minute), e.g. with the fake
+autosub script that waits instead of calling the Google API:
+$ python autosub_executor.py it/clips/*.mp3 -w 8 --autosub "python fake_autosub.py" --sequential "python fake_autosub.py"
+"""
+from __future__ import annotations
+
+import os
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from pathlib import Path
+from plumbum import cli
+from typing import Iterable, Sequence
+
+
+def resolve_autosub_executable(project_dir: str | Path | None = None) -> str:
+    """
+    Returns the path of the autosub executable of the poetry environment of the project in `project_dir`
+    (the current directory by default) or else the one in the PATH.
+    """
+    try:
+        venv_path = subprocess.run(['poetry', 'env', 'info', '--path'], cwd=project_dir, capture_output=True,
+                                   text=True, check=True).stdout.strip()
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        venv_path = ''
+    if venv_path:
+        executable = shutil.which('autosub', path=os.path.join(venv_path, 'Scripts' if os.name == 'nt' else 'bin'))
+        if executable is not None:
+            return executable
+    executable = shutil.which('autosub')
+    if executable is None:
+        raise FileNotFoundError('Could not find `autosub` in the poetry environment nor in the PATH')
+    return executable
+
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    """
+    Kills a process started by `run_process_group` and all the processes it started.
+    """
+    if os.name == 'nt':
+        # /T kills the whole tree of processes
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(process.pid)], capture_output=True)
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:  # already finished
+            pass
+
+
+def run_process_group(args: Sequence[str], timeout: float) -> subprocess.CompletedProcess:
+    """
+    Same as `subprocess.run(args, check=True, capture_output=True, timeout=timeout)` but the process is
+    started in its own process group, which is killed entirely on timeout (or when interrupted). Otherwise
+    only the first process would be killed e.g. `poetry` but not the `autosub` process it started, which
+    would keep running and keep the output pipes open.
+    """
+    group_kwargs = ({'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == 'nt'
+                    else {'start_new_session': True})
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **group_kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            kill_process_group(process)
+            e.output, e.stderr = process.communicate()
+            raise
+        except BaseException:
+            kill_process_group(process)
+            raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+class AutosubExecutor:
+    """
+    Transcribes clips with autosub with at most `num_workers` autosub processes at once
+    (`transcribe` can be called by several threads).
+
+    Parameters
+    ----------
+    language :
+        Localized language for autosub e.g. "it-it" or "uk-ua"
+
+    command :
+        Command starting autosub e.g. `['poetry', 'run', 'autosub']`. By default the executable
+        is looked up once with `resolve_autosub_executable`.
+
+    num_workers :
+        Maximum number of autosub processes running at the same time
+
+    timeout :
+        Number of seconds after which an autosub process (and the processes it started) is killed
+
+    retries :
+        Number of times a clip is transcribed again when autosub fails or times out. The waiting time
+        between tries is `retry_delay` seconds and doubles after each try.
+    """
+    def __init__(self, language: str, command: Sequence[str] | None = None, num_workers: int = 4,
+                 timeout: float = 120, retries: int = 2, retry_delay: float = 1) -> None:
+        self.language = language
+        self.command = list(command) if command is not None else [resolve_autosub_executable()]
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._slots = threading.Semaphore(num_workers)
+        self._temp_dir = tempfile.TemporaryDirectory(prefix='autosub_')
+        # temporary directory of each thread
+        self._local = threading.local()
+
+    def _worker_dir(self) -> Path:
+        if not hasattr(self._local, 'temp_dir'):
+            self._local.temp_dir = Path(tempfile.mkdtemp(dir=self._temp_dir.name))
+        return self._local.temp_dir
+
+    def _run(self, audio_path: Path | str) -> str:
+        output_path = self._worker_dir() / 'transcription.txt'
+        # autosub renames the output path provided via parameter `-o`
+        # slightly to include the language... -_-"
+        output_path_autosub = output_path.with_suffix(f'.{self.language}.txt')
+        try:
+            with self._slots:
+                run_process_group([*self.command, '-S', self.language, '-i', str(audio_path), '-o', str(output_path)],
+                                  timeout=self.timeout)
+            return output_path_autosub.read_text().strip()
+        finally:
+            output_path_autosub.unlink(missing_ok=True)
+
+    def transcribe(self, audio_path: Path | str) -> str:
+        """
+        Returns the transcription of a clip. Raises the error of the last try if all tries failed.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return self._run(audio_path)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.retry_delay * 2**attempt
+                logger.warning(f'autosub failed for {audio_path} ({type(e).__name__}), retrying in {delay}s')
+                time.sleep(delay)
+
+    def transcribe_many(self, audio_paths: Iterable[Path | str]) -> list[str | None]:
+        """
+        Transcribes clips concurrently and returns the transcriptions in the same order
+        (None for the clips that could not be transcribed).
+        """
+        def transcribe(audio_path: Path | str) -> str | None:
+            try:
+                return self.transcribe(audio_path)
+            except Exception:
+                logger.exception(f'Failed to transcribe {audio_path} with autosub')
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            # `map` returns the results in order
+            return list(executor.map(transcribe, audio_paths))
+
+    def close(self) -> None:
+        self._temp_dir.cleanup()
+
+    def __enter__(self) -> AutosubExecutor:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def benchmark_autosub(audio_paths: Iterable[Path | str], language: str, num_workers: int = 4,
+                      command: Sequence[str] | None = None,
+                      sequential_command: Sequence[str] = ('poetry', 'run', 'autosub')) -> dict[str, float]:
+    """
+    Transcribes the clips one after the other with `sequential_command` (like `2_transcribe.ipynb` used to)
+    and then with an `AutosubExecutor` and logs the clips per minute of both.
+
+    Returns the clips per minute and the speedup e.g.
+    {'sequential': 10.2, 'parallel': 71.5, 'speedup': 7.01}
+    """
+    audio_paths = list(audio_paths)
+    results = {}
+    # one process at a time and no retries for the sequential transcriptions
+    for name, executor in (('sequential', AutosubExecutor(language, command=sequential_command, num_workers=1,
+                                                          retries=0)),
+                           ('parallel', AutosubExecutor(language, command=command, num_workers=num_workers))):
+        with executor:
+            start = time.perf_counter()
+            transcriptions = executor.transcribe_many(audio_paths)
+            duration = time.perf_counter() - start
+        results[name] = len(audio_paths) / duration * 60
+        nb_failed = sum(transcription is None for transcription in transcriptions)
+        logger.info(f'{name}: {len(audio_paths)} clips in {duration:.1f}s ({results[name]:.1f} clips/min, '
+                    f'{nb_failed} failed)')
+    results['speedup'] = results['parallel'] / results['sequential']
+    logger.info(f'The executor is {results["speedup"]:.2f}x faster with {num_workers} workers')
+    return results
+
+
+# # Create CLI
+
+class AutosubBenchmark(cli.Application):
+    """
+    Compares the clips per minute of sequential `poetry run autosub` calls and of `AutosubExecutor`.
+    """
+    language = cli.SwitchAttr(['l', 'language'], str, default='it-it',
+                              help='Localized language for autosub')
+    workers = cli.SwitchAttr(['w', 'workers'], int, default=4,
+                             help='Number of autosub processes running at the same time')
+    autosub = cli.SwitchAttr(['autosub'], str, default=None,
+                             help='Command starting autosub for the executor (looked up by default)')
+    sequential = cli.SwitchAttr(['sequential'], str, default='poetry run autosub',
+                                help='Command starting autosub for the sequential transcriptions')
+
+    def main(self, *audio_paths):
+        if not audio_paths:
+            raise ValueError('At least one clip must be given')
+        benchmark_autosub(audio_paths, language=self.language, num_workers=self.workers,
+                          command=shlex.split(self.autosub) if self.autosub else None,
+                          sequential_command=shlex.split(self.sequential))
+
+
+# # Run CLI
+#
+# Only if this file is not imported as a module but run directly.
+
+if __name__ == "__main__":
+    AutosubBenchmark.run()
@@ -0,0 +1,32 @@
+"""
+Stand-in for `autosub` for trying `autosub_executor.py` without calling the Google API.
+It takes the same parameters, waits like autosub would and writes the name of the clip
+to the output file (renamed to include the language, like autosub does).
+
+The behaviour can be changed with environment variables:
+* FAKE_AUTOSUB_DELAY: number of seconds to wait (default 1)
+* FAKE_AUTOSUB_FAILURE_RATE: probability of failing with a non-zero exit code (default 0)
+
+Usage:
+$ python fake_autosub.py -S it-it -i clip.mp3 -o output.txt  # writes "output.it-it.txt"
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-S', dest='language', required=True)
+    parser.add_argument('-i', dest='input', required=True)
+    parser.add_argument('-o', dest='output', required=True)
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get('FAKE_AUTOSUB_DELAY', 1)))
+    if random.random() < float(os.environ.get('FAKE_AUTOSUB_FAILURE_RATE', 0)):
+        sys.exit('fake failure')
+    output_path = Path(args.output)
+    output_path.with_suffix(f'.{args.language}.txt').write_text(f'transcription of {Path(args.input).name}\n')
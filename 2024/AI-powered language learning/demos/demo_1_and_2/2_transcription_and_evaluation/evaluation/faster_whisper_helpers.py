@@ -7,70 +7,174 @@ Notes
 The code is quite strict / opionated (e.g. additional parameters cannot be passed for the transcription
 than the ones I manually defined) as it was not meant to be shared initially and I did
 not take time to "generalize" it more.
+
+`faster_whisper` and `tqdm` are only imported when they are needed (they take a while to import)
+and whisper models are loaded once per process (see `ModelPool`) so that importing this module is fast.
 """
+from __future__ import annotations
+
+import hashlib
 import json
+import multiprocessing
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from array import array
 import os
-from dataclasses import dataclass, field as dataclass_field
-from faster_whisper import WhisperModel
-from faster_whisper.transcribe import Segment, Word
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager, ExitStack
+from dataclasses import dataclass, is_dataclass, replace as dataclass_replace
 from loguru import logger
 from pathlib import Path
-from whisper.utils import get_writer
-from typing import Any, Literal, TypeAlias, TYPE_CHECKING
-from tqdm import tqdm
+from types import SimpleNamespace
+from typing import Any, Iterable, Iterator, Literal, Type, TypeAlias, TYPE_CHECKING
 
 
 if TYPE_CHECKING:
     import pandas as pd
+    from faster_whisper import WhisperModel
+    from faster_whisper.transcribe import Segment, Word
 
 
 # types and type aliases
 OpenAPISegmentData: TypeAlias = list[dict[str, Any]]
 
+# audio as decoded for whisper models
+SAMPLING_RATE = 16000
+# number of samples per frame of whisper models (the unit of `Segment.seek`)
+HOP_LENGTH = 160
+
+
+class WordTimestamps:
+    """
+    Stores the words of the segments of a transcription in columns (arrays) instead of one dict
+    per word. The texts of the words are interned: each distinct word is stored once in `vocabulary`
+    and `word_ids` contains indices in `vocabulary`.
+
+    The words of the nth segment are at positions `segment_offsets[n]` to `segment_offsets[n + 1]`
+    in the columns.
+
+    Examples
+    --------
+    >>> words = WordTimestamps()
+    >>> words.append_segment([(0.0, 0.5, ' Ciao', 0.9), (0.5, 0.9, ' ciao', 0.8)])
+    >>> words.append_segment([{'start': 1.2, 'end': 1.6, 'word': ' Ciao', 'probability': 0.7}])
+    >>> len(words), len(words.vocabulary)
+    (2, 2)
+    >>> words.segment_words(1)
+    [{'start': 1.2, 'end': 1.6, 'word': ' Ciao', 'probability': 0.7}]
+    """
+    def __init__(self) -> None:
+        self.starts = array('d')
+        self.ends = array('d')
+        self.probabilities = array('d')
+        self.word_ids = array('I')
+        self.vocabulary: list[str] = []
+        self.segment_offsets = array('Q', [0])
+        # whether each segment has word timestamps (faster_whisper returns None when they are disabled)
+        self.has_words = array('B')
+        self._vocabulary_ids: dict[str, int] = {}
+
+    def append_segment(self, words: Iterable[tuple[float, float, str, float] | dict[str, Any]] | None) -> None:
+        """
+        Adds the words of the next segment, either faster_whisper `Word` named tuples
+        or OpenAI dicts (or None if there are no word timestamps).
+        """
+        for word in words or ():
+            if isinstance(word, dict):
+                start, end, text, probability = word['start'], word['end'], word['word'], word['probability']
+            else:
+                start, end, text, probability = word
+            word_id = self._vocabulary_ids.get(text)
+            if word_id is None:
+                word_id = self._vocabulary_ids[text] = len(self.vocabulary)
+                self.vocabulary.append(text)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.probabilities.append(probability)
+            self.word_ids.append(word_id)
+        self.segment_offsets.append(len(self.starts))
+        self.has_words.append(words is not None)
+
+    def __len__(self) -> int:
+        """
+        Number of segments
+        """
+        return len(self.has_words)
+
+    def segment_words(self, segment_index: int) -> list[dict[str, Any]] | None:
+        """
+        Returns the words of a segment (by position) in the format of OpenAI.
+        """
+        if not self.has_words[segment_index]:
+            return None
+        vocabulary = self.vocabulary  # alias
+        return [{'start': self.starts[ix], 'end': self.ends[ix], 'word': vocabulary[self.word_ids[ix]],
+                 'probability': self.probabilities[ix]}
+                for ix in range(self.segment_offsets[segment_index], self.segment_offsets[segment_index + 1])]
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the lookup table can be recreated from the vocabulary
+        state = self.__dict__.copy()
+        del state['_vocabulary_ids']
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._vocabulary_ids = {word: ix for ix, word in enumerate(self.vocabulary)}
+
 
 @dataclass(frozen=True)
 class TranscriptionResult:
     """
-    Stores the result of a transcription of given media file at path `media_filepath`
+    Stores the result of a transcription of given media file at path `media_filepath`.
+    `media_duration` is the length of the media and `processing_time` the time it took
+    to transcribe it (both in seconds).
+
+    By default the segments in `segments_data` contain their words like the segments of OpenAI.
+    When `words` is given (see `columnar_words` of `WhisperTranscriber`), they do not contain their
+    words, they are stored in `words` instead and only converted to dicts when needed (see
+    `iter_openai_segments` and `words_dataframe`).
     """
     media_filepath: Path
     source_language: str
     segments_data: OpenAPISegmentData
     is_translation: bool
-    srt_writer: Any = dataclass_field(init=False)
+    media_duration: float | None = None
+    processing_time: float | None = None
+    words: WordTimestamps | None = None
+
+    def _write_subtitles(self, sink_class: Type['SegmentSink'], suffix: str, path: str | Path | None) -> None:
+        if path is None:
+            # e.g. "video.mp4" -> "video_it.srt" ("en" is used for translations)
+            language_suffix = 'en' if self.is_translation else self.source_language
+            path = self.media_filepath.with_stem(f'{self.media_filepath.stem}_{language_suffix}').with_suffix(suffix)
 
-    def __post_init__(self) -> None:
-        srt_writer = get_writer(output_format='srt', output_dir='.')
-        object.__setattr__(self, 'srt_writer', srt_writer)
+        logger.info(f'Saving subtitles: {str(path)}')
+        if os.path.exists(path):
+            logger.warning(f'Overwriting already existing file {path}')
+        write_segments(self.iter_openai_segments(), path=path, sink_class=sink_class)
 
-    def to_srt(self, path: str | None = None) -> None:
+    def to_srt(self, path: str | Path | None = None) -> None:
         """
         Stores the transcription data as a subtitle file.
         If a `path` is not provided, it is automatically generated by using
-        the path of the media and renaming its extension to `.srt`.
+        the path of the media, adding the language to its name and renaming its extension
+        to `.srt` e.g. "video.mp4" -> "video_it.srt".
         """
-        media_filepath = self.media_filepath  # alias
-
-        # generate subtitles to the default path
-        self.srt_writer(result={'segments': self.segments_data}, audio_path=media_filepath)
-
-        # move output file to our desired path (there are other ways to do that but they are annoying
-        # e.g. using your own writer)
-        default_filepath = Path.cwd() / media_filepath.with_suffix('.srt').name
-        language_suffix = 'en' if self.is_translation else self.source_language
-        if path is None:
-            desired_stem = f'{media_filepath.stem}_{language_suffix}'
-            desired_filepath = media_filepath.with_stem(desired_stem).with_suffix('.srt')
-        else:
-            desired_filepath = path
+        self._write_subtitles(SRTSink, suffix='.srt', path=path)
 
-        logger.info(f'Saving subtitles: {str(default_filepath)} -> {str(desired_filepath)}')
-        if os.path.exists(desired_filepath):
-            logger.warning(f'Overwriting already existing file {desired_filepath}')
-            os.remove(desired_filepath)
-        os.rename(default_filepath, desired_filepath)
+    def to_vtt(self, path: str | Path | None = None) -> None:
+        """
+        Same as `to_srt` but for a WebVTT subtitle file (.vtt).
+        """
+        self._write_subtitles(VTTSink, suffix='.vtt', path=path)
 
-    def to_json(self, path: str | None = None) -> None:
+    def to_json(self, path: str | Path | None = None) -> None:
         """
         Saves the data of the transcription (only the segments) to a JSON file.
         If a `path` is not provided, it is automatically generated by using
@@ -80,8 +184,26 @@ class TranscriptionResult:
             json_segments_path = Path(self.media_filepath).with_suffix('.json')
         else:
             json_segments_path = path
-        with open(json_segments_path, mode='w', encoding='utf-8') as fp:
-            json.dump(obj=self.segments_data, fp=fp, ensure_ascii=False, indent=4)
+        with atomic_path(json_segments_path) as temp_path, open(temp_path, mode='w', encoding='utf-8') as fp:
+            json.dump(obj=list(self.iter_openai_segments()), fp=fp, ensure_ascii=False, indent=4)
+
+    def to_jsonl(self, path: str | Path | None = None) -> None:
+        """
+        Same as `to_json` but for a JSON lines file (one segment per line, extension `.jsonl`).
+        """
+        if path is None:
+            path = Path(self.media_filepath).with_suffix('.jsonl')
+        write_segments(self.iter_openai_segments(), path=path, sink_class=JSONLSink)
+
+    def iter_openai_segments(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields the segments in the format of OpenAI (with their words).
+        """
+        if self.words is None:
+            yield from self.segments_data
+            return
+        for ix, segment_data in enumerate(self.segments_data):
+            yield {**segment_data, 'words': self.words.segment_words(ix)}
 
     def to_string(self) -> str:
         """
@@ -96,8 +218,46 @@ class TranscriptionResult:
             import pandas as pd
         except (ModuleNotFoundError, ImportError) as e:
             raise ModuleNotFoundError('Optional dependency `pandas` needs to be installed') from e
+        # with columnar words, there is no "words" column (see `words_dataframe`)
         return pd.DataFrame(self.segments_data).set_index('id')
 
+    @property
+    def words_dataframe(self) -> 'pd.DataFrame':
+        """
+        Words of all segments with the id of their segment. The words are categorical.
+        """
+        try:
+            import numpy as np
+            import pandas as pd
+        except (ModuleNotFoundError, ImportError) as e:
+            raise ModuleNotFoundError('Optional dependency `pandas` needs to be installed') from e
+        words = self.words
+        if words is None:
+            words = WordTimestamps()
+            for segment_data in self.segments_data:
+                words.append_segment(segment_data.get('words'))
+        segment_ids = np.repeat([segment_data['id'] for segment_data in self.segments_data],
+                                np.diff(np.array(words.segment_offsets, dtype=np.int64)))
+        # the columns are copies: a view of an array (`np.frombuffer`) would prevent it from growing
+        # (`append` raises a BufferError as long as the view exists)
+        return pd.DataFrame({'segment_id': segment_ids,
+                             'start': np.array(words.starts, dtype=np.float64),
+                             'end': np.array(words.ends, dtype=np.float64),
+                             'word': pd.Categorical.from_codes(np.array(words.word_ids, dtype=np.int64),
+                                                               categories=pd.Index(words.vocabulary, dtype=object)),
+                             'probability': np.array(words.probabilities, dtype=np.float64)},
+                            copy=False)
+
+    @property
+    def real_time_factor(self) -> float | None:
+        """
+        Processing time divided by the length of the media (lower is faster, e.g. 0.1
+        means that one minute of audio was transcribed in 6 seconds).
+        """
+        if not self.media_duration or self.processing_time is None:
+            return None
+        return self.processing_time / self.media_duration
+
 
 def faster_whisper_segment_to_openapi_whisper_segment(segment: Segment) -> dict[str, Any]:
     """
@@ -107,6 +267,7 @@ def faster_whisper_segment_to_openapi_whisper_segment(segment: Segment) -> dict[
     Examples
     --------
     >>> from pprint import pprint
+    >>> from faster_whisper.transcribe import Segment, Word
     >>> segment_example = Segment(id=3, seek=9000, start=60.0, end=89.9, text=' Дякую за перегляд!',
     ...                           tokens=[50365, 3401, 681, 35119, 4396, 4321, 4953, 2873, 856, 0, 51864],
     ...                           temperature=0.0, avg_logprob=-0.08813476438323657,
@@ -114,7 +275,7 @@ def faster_whisper_segment_to_openapi_whisper_segment(segment: Segment) -> dict[
     ...                           words=[Word(start=60.0, end=66.94, word=' Дякую', probability=0.09035746256510417),
     ...                                  Word(start=66.94, end=67.36, word=' за', probability=0.01708984375),
     ...                                  Word(start=67.36, end=89.9, word=' перегляд!', probability=0.83758544921875)])
-    >>> pprint(faster_whisper_segment_to_openapi_whisper_segment(segment), sort_dicts=False)
+    >>> pprint(faster_whisper_segment_to_openapi_whisper_segment(segment_example), sort_dicts=False)
     {'id': 3,
      'seek': 9000,
      'start': 60.0,
@@ -143,13 +304,453 @@ def faster_whisper_segment_to_openapi_whisper_segment(segment: Segment) -> dict[
     segment_dict = segment._asdict()
     words: list[Word] | None = segment_dict['words']
     if words is not None:
-        words_parsed = [word._asdict() for word in words]
+        # the segments of faster_whisper >= 1.1 are dataclasses whose `_asdict` already converts the words
+        words_parsed = [word if isinstance(word, dict) else word._asdict() for word in words]
     else:
         words_parsed = None
     segment_dict['words'] = words_parsed
     return segment_dict
 
 
+def replace_fields(segment_or_word: Segment | Word, **changes: Any) -> Segment | Word:
+    """
+    Returns a copy of a faster whisper segment or word with some fields changed. They are named
+    tuples in faster_whisper < 1.1 and dataclasses since then.
+
+    Examples
+    --------
+    >>> from faster_whisper.transcribe import Word
+    >>> replace_fields(Word(start=1.0, end=1.5, word=' ciao', probability=0.9), start=2.0, end=2.5)
+    Word(start=2.0, end=2.5, word=' ciao', probability=0.9)
+    """
+    if is_dataclass(segment_or_word):
+        return dataclass_replace(segment_or_word, **changes)
+    return segment_or_word._replace(**changes)
+
+
+def format_srt_timestamp(seconds: float) -> str:
+    """
+    Formats a time in seconds for subtitles like whisper does.
+
+    Examples
+    --------
+    >>> format_srt_timestamp(3725.5)
+    '01:02:05,500'
+    """
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}'
+
+
+def format_vtt_timestamp(seconds: float) -> str:
+    """
+    Formats a time in seconds for WebVTT subtitles like whisper does (hours are omitted when
+    they are 0).
+
+    Examples
+    --------
+    >>> format_vtt_timestamp(65.5), format_vtt_timestamp(3725.5)
+    ('01:05.500', '01:02:05.500')
+    """
+    timestamp = format_srt_timestamp(seconds).replace(',', '.')
+    return timestamp[3:] if timestamp.startswith('00:') else timestamp
+
+
+def segment_to_subtitle(segment: dict[str, Any], format_timestamp=format_srt_timestamp) -> tuple[str, str, str]:
+    """
+    Returns the start, end and text of a subtitle for a segment (in the format of OpenAI)
+    the same way the subtitle writers of whisper do with their default options: when there are
+    word timestamps, the timings of the first and last words are used.
+    """
+    words = segment.get('words')
+    if not words:
+        return (format_timestamp(segment['start']), format_timestamp(segment['end']),
+                segment['text'].strip().replace('-->', '->'))
+    # the first word and words following empty words are stripped (like whisper)
+    text = ''
+    for word in words:
+        text += word['word'] if text else word['word'].strip()
+    return format_timestamp(words[0]['start']), format_timestamp(words[-1]['end']), text
+
+
+class SegmentSink(ABC):
+    """
+    Writes segments (in the format of OpenAI) to a file one by one as they are transcribed.
+    By default the file is flushed after each segment so that it can be read while it is written.
+    Use it as a context manager or call `close`.
+    """
+    # written at the beginning of the file
+    header = ''
+
+    def __init__(self, path: str | Path, flush: bool = True) -> None:
+        self.path = Path(path)
+        self.flush = flush
+        self.nb_segments = 0
+        self._file = open(self.path, mode='w', encoding='utf-8')
+        self._file.write(self.header)
+
+    @abstractmethod
+    def format(self, segment: dict[str, Any]) -> str:
+        """
+        Returns the text written to the file for a segment
+        """
+
+    def write(self, segment: dict[str, Any]) -> None:
+        self.nb_segments += 1
+        self._file.write(self.format(segment))
+        if self.flush:
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> 'SegmentSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SRTSink(SegmentSink):
+    """
+    Writes segments to a subtitle file (.srt), see `SegmentSink`.
+    """
+    def format(self, segment: dict[str, Any]) -> str:
+        start, end, text = segment_to_subtitle(segment)
+        return f'{self.nb_segments}\n{start} --> {end}\n{text}\n\n'
+
+
+class VTTSink(SegmentSink):
+    """
+    Writes segments to a WebVTT subtitle file (.vtt), see `SegmentSink`.
+    """
+    header = 'WEBVTT\n\n'
+
+    def format(self, segment: dict[str, Any]) -> str:
+        start, end, text = segment_to_subtitle(segment, format_timestamp=format_vtt_timestamp)
+        return f'{start} --> {end}\n{text}\n\n'
+
+
+class JSONLSink(SegmentSink):
+    """
+    Writes segments to a JSON lines file (one segment as JSON per line), see `SegmentSink`.
+    """
+    def format(self, segment: dict[str, Any]) -> str:
+        return json.dumps(segment, ensure_ascii=False) + '\n'
+
+
+@contextmanager
+def atomic_path(path: str | Path) -> Iterator[Path]:
+    """
+    Yields a temporary path next to `path` to write to. The temporary file replaces `path`
+    at once when the block ends without errors, so `path` is never partially written (and
+    concurrent writers never mix their outputs).
+    """
+    path = Path(path)
+    temp_path = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def write_segments(segments: Iterable[dict[str, Any]], path: str | Path, sink_class: Type[SegmentSink]) -> None:
+    """
+    Writes segments (in the format of OpenAI) to a file atomically using given sink class
+    e.g. `SRTSink`.
+    """
+    with atomic_path(path) as temp_path, sink_class(temp_path, flush=False) as sink:
+        for segment in segments:
+            sink.write(segment)
+
+
+class TranscriptionCache:
+    """
+    Persistent cache of transcriptions in a SQLite database at `path`. Transcriptions are stored as
+    compressed JSON and identified by the hash of the content of the media (so renaming or moving
+    a file does not matter) together with the model and the parameters of the transcription.
+
+    When the transcriptions take more than `max_size_mb` megabytes, the least recently used
+    ones are deleted.
+
+    The cache can be used by several threads or processes at once (a new connection is
+    opened for each operation).
+    """
+    def __init__(self, path: str | Path = 'transcriptions_cache.sqlite3', max_size_mb: float = 512) -> None:
+        self.path = Path(path)
+        self.max_size_mb = max_size_mb
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS transcriptions '
+                               '(key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_transcriptions_last_used ON transcriptions (last_used)')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # the connection commits (or rolls back) at the end of the block and is then closed
+        # (`with sqlite3.connect(...)` alone does not close it). It waits if another process is writing
+        with closing(sqlite3.connect(self.path, timeout=60)) as connection, connection:
+            yield connection
+
+    @staticmethod
+    def media_hash(media_filepath: str | Path) -> str:
+        """
+        SHA-256 of the content of a media file
+        """
+        sha256 = hashlib.sha256()
+        with open(media_filepath, mode='rb') as fh:
+            while chunk := fh.read(2**20):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def key(self, media_filepath: str | Path, model_id: str, **parameters: Any) -> str:
+        """
+        Creates the key of a transcription from the media, the model and the parameters of the transcription.
+        """
+        identity = json.dumps({'media': self.media_hash(media_filepath), 'model': model_id, **parameters},
+                              sort_keys=True)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        with self._connect() as connection:
+            row = connection.execute('SELECT data FROM transcriptions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE transcriptions SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, key: str, value: dict[str, Any]) -> None:
+        data = zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO transcriptions (key, data, size, last_used) VALUES (?, ?, ?, ?)',
+                               (key, data, len(data), time.time()))
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used transcriptions until the cache is below its maximum size.
+        """
+        max_size = self.max_size_mb * 2**20
+        with self._connect() as connection:
+            total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM transcriptions').fetchone()[0]
+            if total_size <= max_size:
+                return
+            keys = []
+            for key, size in connection.execute('SELECT key, size FROM transcriptions ORDER BY last_used'):
+                if total_size <= max_size:
+                    break
+                keys.append((key,))
+                total_size -= size
+            connection.executemany('DELETE FROM transcriptions WHERE key = ?', keys)
+        logger.info(f'Deleted {len(keys)} transcriptions from the cache {self.path}')
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM transcriptions').fetchone()[0]
+
+
+def group_speech_into_chunks(speech_timestamps: list[dict[str, int]], max_chunk_samples: int) -> list[tuple[int, int]]:
+    """
+    Groups consecutive speech regions (as returned by `faster_whisper.vad.get_speech_timestamps`,
+    in samples) into chunks `(start, end)` that are at most `max_chunk_samples` long (unless a
+    region is longer by itself). The chunks start and end in silences.
+
+    Examples
+    --------
+    >>> group_speech_into_chunks([{'start': 0, 'end': 40}, {'start': 60, 'end': 90}, {'start': 120, 'end': 150}],
+    ...                          max_chunk_samples=100)
+    [(0, 90), (120, 150)]
+    """
+    chunks = []
+    for region in speech_timestamps:
+        if chunks and region['end'] - chunks[-1][0] <= max_chunk_samples:
+            chunks[-1] = (chunks[-1][0], region['end'])
+        else:
+            chunks.append((region['start'], region['end']))
+    return chunks
+
+
+def estimate_model_size_mb(model_size_or_path: str, download_root: str | None = None) -> float:
+    """
+    Approximates the memory used by a whisper model with the size of its files on disk (in megabytes).
+    Returns 0 if the model was not downloaded yet (nothing is downloaded here).
+    """
+    if os.path.isdir(model_size_or_path):
+        model_path = model_size_or_path
+    else:
+        from faster_whisper.utils import download_model
+        try:
+            model_path = download_model(model_size_or_path, local_files_only=True, cache_dir=download_root)
+        except Exception:
+            return 0
+    # the files of the cache of huggingface are symlinks, `getsize` follows them
+    return sum(os.path.getsize(entry.path) for entry in os.scandir(model_path) if entry.is_file()) / 2**20
+
+
+# arguments of `WhisperModel` that do not change the weights of the model, only how it runs
+_RUNTIME_MODEL_KWARGS = ('cpu_threads', 'num_workers')
+
+
+@dataclass
+class _PooledModel:
+    model: WhisperModel
+    size_mb: float
+    last_used: float
+    num_workers: int
+    cpu_threads: int
+
+
+class ModelPool:
+    """
+    Loads whisper models once per process and reuses them (e.g. for all `WhisperTranscriber` instances
+    using the same model). Models are identified by their name or path, their device, their compute type
+    and the other arguments given to `WhisperModel` except `cpu_threads` and `num_workers` which do not
+    change the weights: a model is only loaded again if more workers or another number of threads are
+    requested than the model of the pool has (the new model replaces it). Requests that do not give
+    `cpu_threads` use the model of the pool whatever its number of threads.
+
+    Models that were not used for `idle_timeout` seconds are removed from the pool (in a background
+    timer) and the least recently used models are removed when the models take more than
+    `max_memory_mb` megabytes (see `estimate_model_size_mb`). None disables the corresponding limit.
+
+    IMPORTANT: a removed model only frees its memory once nothing else references it.
+    """
+    def __init__(self, max_memory_mb: float | None = None, idle_timeout: float | None = 1800) -> None:
+        self.max_memory_mb = max_memory_mb
+        self.idle_timeout = idle_timeout
+        # the most recently used models are at the end
+        self._models: OrderedDict[tuple, _PooledModel] = OrderedDict()
+        # models may be requested by several threads (e.g. `BatchWhisperTranscriber`). The lock of the pool
+        # is not held while loading a model (this takes a while), instead each model being loaded has its
+        # own lock so that it is only loaded once and other models can be used in the meantime
+        self._lock = threading.Lock()
+        self._load_locks: dict[tuple, threading.Lock] = {}
+        # removes the idle models, see `_schedule_idle_eviction`
+        self._idle_timer: threading.Timer | None = None
+
+    def _use(self, key: tuple, num_workers: int, cpu_threads: int | None) -> WhisperModel | None:
+        # returns the model of the pool if it can be used (needs the lock of the pool)
+        pooled = self._models.get(key)
+        if (pooled is None or pooled.num_workers < num_workers
+                or (cpu_threads is not None and pooled.cpu_threads != cpu_threads)):
+            return None
+        pooled.last_used = time.monotonic()
+        self._models.move_to_end(key)
+        return pooled.model
+
+    def get(self, model_size_or_path: str, device: str = 'cpu', compute_type: str = 'default',
+            **kwargs: Any) -> WhisperModel:
+        """
+        Returns the model with given arguments (see `WhisperModel`), loading it if it is not in the pool.
+        """
+        key = (model_size_or_path, device, compute_type,
+               tuple(sorted((name, value) for name, value in kwargs.items() if name not in _RUNTIME_MODEL_KWARGS)))
+        num_workers = kwargs.get('num_workers', 1)
+        cpu_threads = kwargs.get('cpu_threads')
+        with self._lock:
+            model = self._use(key, num_workers, cpu_threads)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # another thread may have loaded the model while we were waiting
+            with self._lock:
+                model = self._use(key, num_workers, cpu_threads)
+                if model is not None:
+                    return model
+                replaced = self._models.get(key)
+            if replaced is not None:
+                # keep the workers (and the threads if they are not given) of the model we replace
+                kwargs['num_workers'] = max(num_workers, replaced.num_workers)
+                kwargs.setdefault('cpu_threads', replaced.cpu_threads)
+
+            from faster_whisper import WhisperModel
+            start = time.perf_counter()
+            model = WhisperModel(model_size_or_path=model_size_or_path, device=device,
+                                 compute_type=compute_type, **kwargs)
+            size_mb = estimate_model_size_mb(model_size_or_path, download_root=kwargs.get('download_root'))
+            logger.info(f'Loaded whisper model "{model_size_or_path}" ({device}, {compute_type}, '
+                        f'~{size_mb:.0f} MB) in {time.perf_counter() - start:.1f}s')
+
+            with self._lock:
+                self._models[key] = _PooledModel(model=model, size_mb=size_mb, last_used=time.monotonic(),
+                                                 num_workers=kwargs.get('num_workers', 1),
+                                                 cpu_threads=kwargs.get('cpu_threads', 0))
+                self._models.move_to_end(key)
+                del self._load_locks[key]
+                self._evict(keep=key)
+                self._schedule_idle_eviction()
+            return model
+
+    def _evict(self, keep: tuple | None = None) -> None:
+        now = time.monotonic()
+        for key, pooled in list(self._models.items()):
+            if key != keep and self.idle_timeout is not None and now - pooled.last_used >= self.idle_timeout:
+                self._remove(key, reason=f'idle for more than {self.idle_timeout}s')
+        if self.max_memory_mb is None:
+            return
+        for key in list(self._models):
+            if key == keep or self.memory_mb <= self.max_memory_mb:
+                break
+            self._remove(key, reason=f'the models take more than {self.max_memory_mb} MB')
+
+    def _schedule_idle_eviction(self) -> None:
+        # starts a timer for when the least recently used model becomes idle (needs the lock of the pool).
+        # The timer does not keep the process alive (daemon thread)
+        if self.idle_timeout is None or not self._models or self._idle_timer is not None:
+            return
+        oldest = next(iter(self._models.values()))
+        delay = max(0., oldest.last_used + self.idle_timeout - time.monotonic())
+        self._idle_timer = threading.Timer(delay, self._evict_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _evict_idle(self) -> None:
+        with self._lock:
+            self._idle_timer = None
+            self._evict()
+            # the models used in the meantime become idle later
+            self._schedule_idle_eviction()
+
+    def _remove(self, key: tuple, reason: str) -> None:
+        del self._models[key]
+        logger.info(f'Removed whisper model "{key[0]}" ({key[1]}, {key[2]}) from the pool: {reason}')
+
+    @property
+    def memory_mb(self) -> float:
+        """
+        Approximate memory used by the models of the pool in megabytes
+        """
+        return sum(pooled.size_mb for pooled in self._models.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+# pool used by the transcribers of this module when they are given the name of a model
+model_pool = ModelPool()
+
+
+def get_model(model_size_or_path: str, device: str = 'cpu', compute_type: str = 'default',
+              **kwargs: Any) -> WhisperModel:
+    """
+    Returns a model from the pool of this process (see `ModelPool`)
+    """
+    return model_pool.get(model_size_or_path, device=device, compute_type=compute_type, **kwargs)
+
+
 @dataclass(frozen=True)
 class WhisperTranscriber:
     """
@@ -158,7 +759,9 @@ class WhisperTranscriber:
     Parameters
     ----------
     model :
-        An OpenAI Whisper model e.g. "large-v3"
+        Either a loaded model or the name or path of an OpenAI Whisper model e.g. "large-v3" which
+        is then loaded when the first transcription starts and shared with the other transcribers
+        of the process (see `ModelPool`)
 
     media_filepath :
         Path of given media
@@ -184,13 +787,60 @@ class WhisperTranscriber:
 
         IMPORTANT: subtitles generated when transcribing and translating have different timings, making them very
         impractical for watching a media with the two subtitles display at once.
+
+    show_progress :
+        Whether to show a progress bar (in audio seconds)
+
+    cache :
+        If given, `transcribe` returns the transcription from the cache when the same media was already
+        transcribed with the same model and parameters (see `TranscriptionCache`).
+
+    model_id :
+        Identifies the model in the cache e.g. "large-v3-float32" (required when using a cache with a
+        loaded model since it does not know its name). It should change whenever the model or its
+        settings (e.g. the compute type) change. When `model` is a string, it defaults to the model,
+        the device and the compute type.
+
+    vad_chunking :
+        If True, the media is split into chunks of speech (using voice activity detection) at
+        silences and `chunk_workers` chunks are transcribed at the same time. This is a lot faster
+        for long media but the chunks are independent: the text of a chunk is not used as context
+        for the next one even if `condition_on_previous_text` is True (`initial_prompt` is used for
+        every chunk). See also `compare_chunked_transcription`.
+
+        IMPORTANT: a loaded model only transcribes the chunks in parallel if it was created with `num_workers`
+        greater than 1 (`WhisperModel(..., num_workers=4)`). When `model` is a string, it is loaded
+        with `num_workers=chunk_workers`.
+
+    max_chunk_duration :
+        Maximum length of a chunk in seconds when using `vad_chunking`
+
+    chunk_workers :
+        Number of chunks transcribed at the same time when using `vad_chunking`
+
+    device, compute_type :
+        See `WhisperModel`, only used when `model` is a string
+
+    columnar_words :
+        If True, the words of the segments returned by `transcribe` are stored in columns (see
+        `WordTimestamps`) instead of one dict per word which uses a lot less memory for long media.
+        The segments of the result then do not contain their words (see `TranscriptionResult`).
     """
-    model: WhisperModel
+    model: WhisperModel | str
     media_filepath: Path
     source_language: str
     initial_prompt: str | None = None
     condition_on_previous_text: bool = True
     task: Literal['translate', 'transcribe'] = 'transcribe'
+    show_progress: bool = True
+    cache: TranscriptionCache | None = None
+    model_id: str | None = None
+    vad_chunking: bool = False
+    max_chunk_duration: float = 300
+    chunk_workers: int = 4
+    device: str = 'cpu'
+    compute_type: str = 'default'
+    columnar_words: bool = False
 
     def __post_init__(self):
         if isinstance(self.media_filepath, str):
@@ -198,28 +848,93 @@ class WhisperTranscriber:
         else:
             media_filepath = self.media_filepath
         object.__setattr__(self, 'media_filepath', media_filepath.resolve())
+        if self.model_id is None and isinstance(self.model, str):
+            object.__setattr__(self, 'model_id', f'{self.model}-{self.device}-{self.compute_type}')
+        if self.cache is not None and self.model_id is None:
+            raise ValueError('A `model_id` must be given when using a cache with a loaded model')
+
+    def _get_model(self) -> WhisperModel:
+        if not isinstance(self.model, str):
+            return self.model
+        # the chunks can only be transcribed in parallel by a model with several workers
+        model_kwargs = {'num_workers': self.chunk_workers} if self.vad_chunking else {}
+        return get_model(self.model, device=self.device, compute_type=self.compute_type, **model_kwargs)
+
+    def _cache_key(self) -> str:
+        # only add the chunking parameters when chunking so that existing keys do not change
+        chunking_parameters = ({'max_chunk_duration': self.max_chunk_duration} if self.vad_chunking else {})
+        return self.cache.key(self.media_filepath, model_id=self.model_id, source_language=self.source_language,
+                              task=self.task, initial_prompt=self.initial_prompt,
+                              condition_on_previous_text=self.condition_on_previous_text, **chunking_parameters)
+
+    def _start_chunked_transcription(self) -> tuple[Iterator[Segment], Any]:
+        from faster_whisper.audio import decode_audio
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        model = self._get_model()
+        audio = decode_audio(str(self.media_filepath), sampling_rate=SAMPLING_RATE)
+        media_duration = len(audio) / SAMPLING_RATE
+        logger.info(f'File "{self.media_filepath}" has a length of {round(media_duration, 2)} audio seconds')
+
+        speech_timestamps = get_speech_timestamps(audio, VadOptions(max_speech_duration_s=self.max_chunk_duration))
+        chunks = group_speech_into_chunks(speech_timestamps, max_chunk_samples=int(self.max_chunk_duration * SAMPLING_RATE))
+        logger.info(f'Split "{self.media_filepath}" into {len(chunks)} chunks of speech')
+
+        def transcribe_chunk(chunk: tuple[int, int]) -> list[Segment]:
+            start, end = chunk
+            segments_gen, _ = model.transcribe(audio=audio[start:end],
+                                               word_timestamps=True,
+                                               language=self.source_language,
+                                               task=self.task,
+                                               initial_prompt=self.initial_prompt,
+                                               condition_on_previous_text=self.condition_on_previous_text)
+            # the transcription happens while iterating
+            return list(segments_gen)
+
+        def iter_stitched_segments() -> Iterator[Segment]:
+            segment_id = 0
+            with ThreadPoolExecutor(max_workers=self.chunk_workers) as executor:
+                # `map` returns the chunks in order
+                for (chunk_start, _), segments in zip(chunks, executor.map(transcribe_chunk, chunks)):
+                    # make the timestamps relative to the media instead of the chunk and number the segments again
+                    offset = chunk_start / SAMPLING_RATE
+                    for segment in segments:
+                        segment_id += 1
+                        words = segment.words
+                        if words is not None:
+                            words = [replace_fields(word, start=round(word.start + offset, 3),
+                                                    end=round(word.end + offset, 3))
+                                     for word in words]
+                        yield replace_fields(segment, id=segment_id, seek=segment.seek + chunk_start // HOP_LENGTH,
+                                             start=round(segment.start + offset, 3),
+                                             end=round(segment.end + offset, 3), words=words)
+
+        return iter_stitched_segments(), SimpleNamespace(duration=media_duration)
+
+    def _start_transcription(self) -> tuple[Iterator[Segment], Any]:
+        if self.vad_chunking:
+            return self._start_chunked_transcription()
 
-    def transcribe(self) -> TranscriptionResult:
         # prepare generator of segments + get some info on the media
-        segments_gen, info = self.model.transcribe(audio=str(self.media_filepath),  # Path objects not supported
-                                                   word_timestamps=True,
-                                                   language=self.source_language,
-                                                   task=self.task,
-                                                   initial_prompt=self.initial_prompt,
-                                                   condition_on_previous_text=self.condition_on_previous_text)
-        media_duration = round(info.duration, 2)
-        logger.info(f'File "{self.media_filepath}" has a length of {media_duration} audio seconds')
+        segments_gen, info = self._get_model().transcribe(audio=str(self.media_filepath),  # Path objects not supported
+                                                          word_timestamps=True,
+                                                          language=self.source_language,
+                                                          task=self.task,
+                                                          initial_prompt=self.initial_prompt,
+                                                          condition_on_previous_text=self.condition_on_previous_text)
+        logger.info(f'File "{self.media_filepath}" has a length of {round(info.duration, 2)} audio seconds')
+        return segments_gen, info
+
+    def _iter_segments(self, segments_gen: Iterator[Segment], media_duration: float) -> Iterator[Segment]:
+        from tqdm import tqdm
 
         # prepare generator iteration
         current_time = 0
-        segments_data = []
 
         # get transcription from segments
-        with tqdm(total=media_duration, unit=' audio seconds') as progress_bar:
-            for ix, segment in enumerate(segments_gen):
-                # convert named tuples to dict
-                segment_data = faster_whisper_segment_to_openapi_whisper_segment(segment=segment)
-                segments_data.append(segment_data)
+        with tqdm(total=round(media_duration, 2), unit=' audio seconds', disable=not self.show_progress) as progress_bar:
+            for segment in segments_gen:
+                yield segment
 
                 # show progress
                 progress_bar.update(segment.end - current_time)
@@ -227,5 +942,219 @@ class WhisperTranscriber:
                 # set the new current time for the next loop
                 current_time = segment.end
 
+    def iter_segments(self, sinks: Iterable['SegmentSink'] = ()) -> Iterator[dict[str, Any]]:
+        """
+        Yields the segments (in the format of OpenAI, see `faster_whisper_segment_to_openapi_whisper_segment`)
+        as soon as they are transcribed instead of collecting them all. Each segment is also written to
+        given `sinks` (see `SRTSink`, `VTTSink` and `JSONLSink`) before it is yielded.
+        """
+        segments_gen, info = self._start_transcription()
+        for segment in self._iter_segments(segments_gen, media_duration=info.duration):
+            # convert named tuples to dict
+            segment_data = faster_whisper_segment_to_openapi_whisper_segment(segment=segment)
+            for sink in sinks:
+                sink.write(segment_data)
+            yield segment_data
+
+    def transcribe_to_files(self, srt_path: str | Path | None = None, jsonl_path: str | Path | None = None,
+                            vtt_path: str | Path | None = None) -> int:
+        """
+        Transcribes the media and appends each segment to subtitle files and/or a JSON lines file as soon
+        as it is transcribed. Only one segment is kept in memory at a time and the files can be read
+        (e.g. with `tail -f`) while the transcription is running.
+
+        Returns the number of segments.
+        """
+        if srt_path is None and jsonl_path is None and vtt_path is None:
+            raise ValueError('At least one of `srt_path`, `vtt_path` and `jsonl_path` must be given')
+        with ExitStack() as stack:
+            sinks = [stack.enter_context(sink_class(path))
+                     for sink_class, path in ((SRTSink, srt_path), (VTTSink, vtt_path), (JSONLSink, jsonl_path))
+                     if path is not None]
+            return sum(1 for _ in self.iter_segments(sinks=sinks))
+
+    def _result(self, segments: Iterable[dict[str, Any]], media_duration: float, start: float) -> TranscriptionResult:
+        # `segments` are in the format of OpenAI (with their words)
+        segments_data = []
+        # the words are stored in columns instead of dicts if requested (see `WordTimestamps`)
+        words = WordTimestamps() if self.columnar_words else None
+        for segment_data in segments:
+            if words is not None:
+                words.append_segment(segment_data.pop('words'))
+            segments_data.append(segment_data)
         return TranscriptionResult(media_filepath=self.media_filepath, source_language=self.source_language,
-                                   segments_data=segments_data, is_translation=self.task == 'translate')
+                                   segments_data=segments_data, is_translation=self.task == 'translate',
+                                   media_duration=media_duration, processing_time=time.perf_counter() - start,
+                                   words=words)
+
+    def transcribe(self) -> TranscriptionResult:
+        """
+        Transcribes the media (or gets the transcription from the cache, in which case the `processing_time`
+        of the result is the time it took to get it from the cache).
+        """
+        start = time.perf_counter()
+
+        if self.cache is not None:
+            cache_key = self._cache_key()
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f'Got the transcription of "{self.media_filepath}" from the cache')
+                return self._result(cached['segments'], media_duration=cached['media_duration'], start=start)
+
+        segments_gen, info = self._start_transcription()
+        segments = (faster_whisper_segment_to_openapi_whisper_segment(segment=segment)
+                    for segment in self._iter_segments(segments_gen, media_duration=info.duration))
+        result = self._result(segments, media_duration=info.duration, start=start)
+        if self.cache is not None:
+            self.cache.set(cache_key, {'media_duration': info.duration, 'segments': list(result.iter_openai_segments())})
+        return result
+
+
+def compare_chunked_transcription(transcriber: WhisperTranscriber) -> dict[str, float]:
+    """
+    Transcribes the media of given transcriber normally and with `vad_chunking` (without using
+    the cache) and logs the wall-clock speedup of the chunking. The model is loaded before
+    (with the workers needed for the chunks) and used for both transcriptions so that the
+    durations do not include loading it.
+
+    Returns the durations in seconds and the speedup e.g.
+    {'sequential': 120.5, 'chunked': 35.2, 'speedup': 3.42}
+    """
+    model = dataclass_replace(transcriber, vad_chunking=True)._get_model()
+    durations = {}
+    for name, vad_chunking in (('sequential', False), ('chunked', True)):
+        start = time.perf_counter()
+        dataclass_replace(transcriber, model=model, vad_chunking=vad_chunking, cache=None).transcribe()
+        durations[name] = time.perf_counter() - start
+    durations['speedup'] = durations['sequential'] / durations['chunked']
+    logger.info(f'Transcribing "{transcriber.media_filepath}" took {durations["sequential"]:.1f}s normally and '
+                f'{durations["chunked"]:.1f}s with VAD chunking ({transcriber.chunk_workers} workers): '
+                f'{durations["speedup"]:.2f}x faster')
+    return durations
+
+
+# model of the current worker process of `BatchWhisperTranscriber` (when using processes)
+_worker_model: WhisperModel | None = None
+
+
+def _init_worker_model(model_size_or_path: str, device: str, compute_type: str, cpu_threads: int) -> None:
+    global _worker_model
+    _worker_model = get_model(model_size_or_path, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribe_with_worker_model(parameters: dict[str, Any]) -> TranscriptionResult:
+    return WhisperTranscriber(model=_worker_model, **parameters).transcribe()
+
+
+@dataclass(frozen=True)
+class BatchWhisperTranscriber:
+    """
+    Transcribes many media files concurrently using whisper.
+
+    Parameters
+    ----------
+    model :
+        Either a loaded model which is then shared by all workers (threads) or the name or path
+        of a model e.g. "large-v3" which is then loaded once (threads) or once per worker (processes)
+        and kept for the next batches (see `ModelPool`).
+
+        IMPORTANT: a loaded model only transcribes in parallel if it was created with `num_workers`
+        greater than 1 (`WhisperModel(..., num_workers=4)`).
+
+    source_language, initial_prompt, condition_on_previous_text, task :
+        See `WhisperTranscriber`
+
+    num_workers :
+        Number of media files transcribed at the same time
+
+    cpu_threads :
+        Number of threads used by the model for each transcription. With processes, the default (0)
+        splits the CPU cores between the workers. Otherwise see `WhisperModel`.
+
+    executor :
+        * "thread": the workers are threads sharing one model. Uses less memory.
+        * "process": each worker is a process with its own model. Only possible if `model` is a string.
+
+    device, compute_type :
+        See `WhisperModel`, only used when `model` is a string
+
+    show_progress :
+        Whether to show a progress bar (in media files)
+
+    cache, model_id :
+        See `WhisperTranscriber`. When `model` is a string, `model_id` defaults to the model, the device
+        and the compute type.
+
+    columnar_words :
+        See `WhisperTranscriber`
+    """
+    model: WhisperModel | str
+    source_language: str
+    initial_prompt: str | None = None
+    condition_on_previous_text: bool = True
+    task: Literal['translate', 'transcribe'] = 'transcribe'
+    num_workers: int = 1
+    cpu_threads: int = 0
+    executor: Literal['thread', 'process'] = 'thread'
+    device: str = 'cpu'
+    compute_type: str = 'default'
+    show_progress: bool = True
+    cache: TranscriptionCache | None = None
+    model_id: str | None = None
+    columnar_words: bool = False
+
+    def __post_init__(self):
+        if self.model_id is None and isinstance(self.model, str):
+            object.__setattr__(self, 'model_id', f'{self.model}-{self.device}-{self.compute_type}')
+        if self.executor == 'process' and not isinstance(self.model, str):
+            raise ValueError('A model name or path must be given for transcribing with processes '
+                             '(a loaded model cannot be shared between processes)')
+
+    def transcribe(self, media_filepaths: Iterable[Path | str]) -> list[TranscriptionResult]:
+        """
+        Transcribes given media files and returns the results in the same order.
+        The real-time factor of the whole batch is logged.
+        """
+        media_filepaths = list(media_filepaths)
+        parameters = [dict(media_filepath=media_filepath, source_language=self.source_language,
+                           initial_prompt=self.initial_prompt,
+                           condition_on_previous_text=self.condition_on_previous_text,
+                           task=self.task, show_progress=False, cache=self.cache, model_id=self.model_id,
+                           columnar_words=self.columnar_words)
+                      for media_filepath in media_filepaths]
+        start = time.perf_counter()
+
+        if self.executor == 'process':
+            cpu_threads = self.cpu_threads or max(1, (os.cpu_count() or 1) // self.num_workers)
+            # "spawn" because the libraries used by the models do not support being forked
+            executor = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=_init_worker_model,
+                                           initargs=(self.model, self.device, self.compute_type, cpu_threads))
+            transcribe = _transcribe_with_worker_model
+        else:
+            if isinstance(self.model, str):
+                model = get_model(self.model, device=self.device, compute_type=self.compute_type,
+                                  cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+            else:
+                model = self.model
+            executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+            def transcribe(parameters: dict[str, Any]) -> TranscriptionResult:
+                return WhisperTranscriber(model=model, **parameters).transcribe()
+
+        from tqdm import tqdm
+
+        # `map` returns the results in order
+        with executor, tqdm(total=len(parameters), unit=' files', disable=not self.show_progress) as progress_bar:
+            results = []
+            for result in executor.map(transcribe, parameters):
+                results.append(result)
+                progress_bar.update(1)
+        duration = time.perf_counter() - start
+
+        media_duration = sum(result.media_duration for result in results)
+        if media_duration > 0:
+            logger.info(f'Transcribed {len(results)} files ({media_duration:.1f} audio seconds) in {duration:.1f}s '
+                        f'with {self.num_workers} {self.executor} worker(s): real-time factor of '
+                        f'{duration / media_duration:.3f} ({media_duration / duration:.1f}x real time)')
+        return results
@@ -0,0 +1,41 @@
+"""Checks of faster_whisper_helpers.py that do not need a whisper model (run with pytest from this folder)."""
+
+import pytest
+
+pytest.importorskip('faster_whisper')
+pytest.importorskip('tqdm')
+import faster_whisper.audio
+import faster_whisper.vad
+import numpy as np
+from faster_whisper.transcribe import Segment, Word
+
+import faster_whisper_helpers
+
+
+class ChunkModel:
+    """transcribes every chunk of audio as one segment of two words (timestamps relative to the chunk)"""
+    def transcribe(self, audio, **kwargs):
+        duration = len(audio) / faster_whisper_helpers.SAMPLING_RATE
+        words = [Word(start=0.0, end=duration / 2, word=' ciao', probability=0.9),
+                 Word(start=duration / 2, end=duration, word=' mondo', probability=0.8)]
+        segment = Segment(id=1, seek=0, start=0.0, end=duration, text=' ciao mondo', tokens=[1, 2],
+                          avg_logprob=-0.1, compression_ratio=1.0, no_speech_prob=0.01, words=words,
+                          temperature=0.0)
+        return iter([segment]), None
+
+def test_vad_chunking_dataclass_segments(monkeypatch, tmp_path):
+    sampling_rate = faster_whisper_helpers.SAMPLING_RATE
+    # 4 seconds of audio with speech in the first and the last second
+    monkeypatch.setattr(faster_whisper.audio, 'decode_audio', lambda *args, **kwargs: np.zeros(4 * sampling_rate))
+    monkeypatch.setattr(faster_whisper.vad, 'get_speech_timestamps',
+                        lambda *args, **kwargs: [{'start': 0, 'end': sampling_rate},
+                                                 {'start': 3 * sampling_rate, 'end': 4 * sampling_rate}])
+    transcriber = faster_whisper_helpers.WhisperTranscriber(model=ChunkModel(), media_filepath=tmp_path / 'clip.mp3',
+                                                            source_language='it', show_progress=False,
+                                                            vad_chunking=True, max_chunk_duration=1)
+    segments = transcriber.transcribe().segments_data
+    # the segments of the second chunk are relative to the media and numbered after the first chunk
+    assert [(segment['id'], segment['start'], segment['end']) for segment in segments] == [(1, 0.0, 1.0), (2, 3.0, 4.0)]
+    assert segments[1]['seek'] == 3 * sampling_rate // faster_whisper_helpers.HOP_LENGTH
+    assert [(word['start'], word['end'], word['word']) for word in segments[1]['words']] == [(3.0, 3.5, ' ciao'),
+                                                                                            (3.5, 4.0, ' mondo')]
@@ -0,0 +1,176 @@
+"""
+Runs the transcriptions of the sample clips for the evaluation (see `2_transcribe.ipynb`).
+
+The runner can be interrupted and started again: the clips that were already transcribed by a tool
+are fetched in one query and skipped. The clips are transcribed concurrently (with a pool of workers
+per transcriber) and the results are saved in batches instead of one upsert per clip.
+"""
+from __future__ import annotations
+
+import datetime
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from loguru import logger
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple, Protocol
+
+import pandas as pd
+import sqlalchemy as sqla
+from pangres import upsert
+from sqlalchemy import Connection, Engine, text
+
+
+class Transcriber(Protocol):
+    asr_tool: str
+
+    @staticmethod
+    def transcribe(audio_path: Path | str) -> str:
+        ...
+
+
+class Clip(NamedTuple):
+    """
+    A clip to transcribe. `path` is the name of the clip in the dataset (e.g. "common_voice_it_123.mp3")
+    and `audio_path` the path of its file.
+    """
+    path: str
+    sentence_id: str
+    audio_path: Path | str
+
+
+def load_transcribed_keys(connection: Connection, table_name: str = 'transcriptions') -> set[tuple[str, str]]:
+    """
+    Returns the `(path, asr_tool)` of the clips that were successfully transcribed
+    (failed transcriptions are set to NULL and are not returned so that they are tried again).
+    """
+    if table_name not in sqla.inspect(connection).get_table_names():
+        return set()
+    statement = text(f'SELECT path, asr_tool FROM {table_name} WHERE transcription IS NOT NULL')
+    return set(map(tuple, connection.execute(statement)))
+
+
+class TranscriptionRecordBuffer:
+    """
+    Collects the records of transcriptions and upserts them in the table `table_name` every
+    `batch_size` records (the transaction is committed after each batch).
+    Call `flush` at the end to save the remaining records.
+    """
+    def __init__(self, connection: Connection, cv_version: str, table_name: str = 'transcriptions',
+                 batch_size: int = 100) -> None:
+        self.connection = connection
+        self.cv_version = cv_version
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.nb_saved = 0
+        self._records: list[dict[str, Any]] = []
+
+    def add(self, clip: Clip, asr_tool: str, transcription: str | None, duration: float | None) -> None:
+        self._records.append({'updated': datetime.datetime.now().astimezone(datetime.timezone.utc),
+                              'path': clip.path, 'sentence_id': clip.sentence_id, 'transcription': transcription,
+                              'asr_tool': asr_tool, 'cv_version': self.cv_version, 'duration': duration})
+        if len(self._records) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._records:
+            return
+        df_transcriptions = pd.DataFrame(self._records).set_index(['path', 'asr_tool'])
+        upsert(df=df_transcriptions, if_row_exists='update', con=self.connection, table_name=self.table_name,
+               chunksize=1000, create_table=True)
+        self.connection.commit()
+        self.nb_saved += len(self._records)
+        self._records.clear()
+
+
+def transcribe_clip(transcriber: Transcriber, clip: Clip) -> tuple[str | None, float | None]:
+    """
+    Returns the transcription of a clip and the time it took in seconds
+    (or None and None if the transcription failed).
+    """
+    try:
+        start = time.perf_counter()
+        transcription = transcriber.transcribe(audio_path=clip.audio_path)
+        return transcription, time.perf_counter() - start
+    except Exception:
+        logger.exception(f'Failed to transcribe {clip.path} with {transcriber.asr_tool}, marking transcription as NULL')
+        return None, None
+
+
+@dataclass(frozen=True)
+class TranscriptionRunner:
+    """
+    Transcribes clips with several transcribers and saves the transcriptions in a table.
+
+    Parameters
+    ----------
+    engine :
+        Engine of the database of the transcriptions
+
+    cv_version :
+        Version of the common voices dataset, saved with each transcription
+
+    table_name :
+        Table of the transcriptions (created if it does not exist)
+
+    batch_size :
+        Number of transcriptions saved at once
+
+    num_workers :
+        Number of clips transcribed at the same time by each transcriber by `asr_tool`
+        e.g. `{'autosub': 8}` (1 for the transcribers that are not given)
+    """
+    engine: Engine
+    cv_version: str
+    table_name: str = 'transcriptions'
+    batch_size: int = 100
+    num_workers: dict[str, int] = field(default_factory=dict)
+
+    def run(self, clips: Iterable[Clip], transcribers: Iterable[Transcriber]) -> int:
+        """
+        Transcribes the clips that were not transcribed yet by each transcriber and returns
+        the number of saved transcriptions. All the transcribers run at the same time.
+        """
+        clips = list(clips)
+        transcribers = list(transcribers)
+        start = time.perf_counter()
+
+        with self.engine.connect() as connection:
+            done = load_transcribed_keys(connection, table_name=self.table_name)
+            buffer = TranscriptionRecordBuffer(connection, cv_version=self.cv_version, table_name=self.table_name,
+                                               batch_size=self.batch_size)
+            executors = {transcriber.asr_tool: ThreadPoolExecutor(max_workers=self.num_workers.get(transcriber.asr_tool, 1))
+                         for transcriber in transcribers}
+            try:
+                futures: dict[Future, tuple[Transcriber, Clip]] = {}
+                for transcriber in transcribers:
+                    pending = [clip for clip in clips if (clip.path, transcriber.asr_tool) not in done]
+                    logger.info(f'{transcriber.asr_tool}: {len(clips) - len(pending)} clips already transcribed, '
+                                f'{len(pending)} to go')
+                    for clip in pending:
+                        future = executors[transcriber.asr_tool].submit(transcribe_clip, transcriber, clip)
+                        futures[future] = (transcriber, clip)
+
+                # the records are only written by this thread (the connection cannot be shared between threads)
+                for ix, future in enumerate(as_completed(futures)):
+                    transcriber, clip = futures.pop(future)
+                    transcription, duration = future.result()
+                    buffer.add(clip, asr_tool=transcriber.asr_tool, transcription=transcription, duration=duration)
+                    # show progress inline
+                    print(f'{ix + 1}/{ix + 1 + len(futures)} done', end='\r')
+            finally:
+                # save what was transcribed even if the run is interrupted
+                # (the clips being transcribed are finished, the others are cancelled)
+                for executor in executors.values():
+                    executor.shutdown(cancel_futures=True)
+                for future, (transcriber, clip) in futures.items():
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        transcription, duration = future.result()
+                        buffer.add(clip, asr_tool=transcriber.asr_tool, transcription=transcription,
+                                   duration=duration)
+                buffer.flush()
+
+        duration = time.perf_counter() - start
+        logger.info(f'Saved {buffer.nb_saved} transcriptions in {duration:.1f}s '
+                    f'({buffer.nb_saved / duration * 60:.1f} clips/min)')
+        return buffer.nb_saved
@@ -1,5 +1,20 @@
 import base64
+import codecs
+import glob
+import hashlib
+import html
+import io
+import json
+import mmap
+import multiprocessing
 import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 from bs4 import BeautifulSoup, NavigableString
 from plumbum import cli
 from loguru import logger
@@ -8,32 +23,770 @@ from loguru import logger
 # # Helpers
 
 # +
-def get_data_string(src):
+# result of the processing of an HTML file (`sha256` is the hash of the file after processing)
+EmbedResult = namedtuple('EmbedResult', ['html_file', 'nb_bytes', 'duration', 'sha256', 'skipped'])
+
+# regexes for tokenizing raw HTML without parsing it (see `scan_html_file` and `_iter_html_tokens`)
+_tag_regex = r'''<({names})\b((?:[^>"']|"[^"]*"|'[^']*')*)>'''
+_image_tag_regex = re.compile(_tag_regex.format(names='img|link'), flags=re.IGNORECASE)
+_image_tag_start_regex = re.compile(r'<(?:img|link)\b', flags=re.IGNORECASE)
+_stream_tag_regex = re.compile(_tag_regex.format(names='img|link|script|style|head|title'), flags=re.IGNORECASE)
+_stream_end_tag_regex = re.compile(r'</(body|html)\b[^>]*>', flags=re.IGNORECASE)
+_stream_token_regex = re.compile(r'<!--|<(?:img|link|script|style|head|title)\b|</(?:body|html)\b', flags=re.IGNORECASE)
+_raw_text_end_regexes = {name: re.compile(rf'</{name}\b', flags=re.IGNORECASE) for name in ('script', 'style', 'title')}
+_attribute_regex = re.compile(r'''([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?''')
+_chunk_size = 2**20
+# tags longer than this (e.g. a quote that is never closed) are not waited for until the end of the file
+_max_tag_size = 16 * _chunk_size
+
+# script added at the end of the body of HTML files when images are deduplicated (see `ImageEmbedder`),
+# the list of data strings is written between the start and the end
+_dedup_script_start = '''<script>
+(function (images) {
+    // decode every distinct image once and let all the tags referencing it share an object URL
+    var urls = images.map(function (dataString) {
+        var separator = dataString.indexOf(',');
+        var mediaType = dataString.slice(5, separator).split(';')[0];
+        var bytes = atob(dataString.slice(separator + 1));
+        var array = new Uint8Array(bytes.length);
+        for (var i = 0; i < bytes.length; i++) {
+            array[i] = bytes.charCodeAt(i);
+        }
+        return URL.createObjectURL(new Blob([array], {type: mediaType}));
+    });
+    ['src', 'href'].forEach(function (attr) {
+        document.querySelectorAll('[data-embedded-' + attr + ']').forEach(function (element) {
+            element.setAttribute(attr, urls[element.getAttribute('data-embedded-' + attr)]);
+        });
+    });
+})(['''
+_dedup_script_end = ''']);
+</script>'''
+
+# options of the recompression of images (see `recompress_image`)
+RecompressOptions = namedtuple('RecompressOptions', ['format', 'max_width', 'quality'])
+
+# in-process memo of data strings: {(real path, mtime, size, recompress): data string}
+# only data strings up to `_memo_max_size` characters (e.g. logos or recompressed images) are memoized
+# to keep memory usage low
+_data_strings_memo = {}
+_memo_max_size = 2**20
+
+# images are base64 encoded by chunks of this size (multiple of 3 so that chunks can be encoded independently)
+_base64_chunk_size = 3 * 2**18
+
+class DiskCache:
+    """
+    Cache of data strings shared across runs (and processes). Entries
+    are files in `directory` named after a hash of the content of the
+    image and of the encoding options (see `content_key`), so copies of
+    an image (e.g. the same logo in several decks) share one entry.
+
+    So that looking up an image does not require reading it, small
+    index files named after a hash of the real path, the modification
+    time and the size of the image and of the options (see `key`)
+    point to the entries. When the cache grows above `max_size` bytes
+    the least recently used files are evicted.
+
+    The size of the cache is tracked with a counter (the directory is
+    only scanned when the cache is created and when the counter goes
+    above `max_size`), entries written by other processes are thus only
+    taken into account at the next eviction.
+    """
+    # suffix of the index files
+    index_suffix = '.key'
+
+    def __init__(self, directory, max_size=512 * 2**20):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(path, stat, *options):
+        """
+        Returns the key of the data string of the image at `path` (`stat`
+        being the result of `os.stat(path)`) encoded with given options.
+        """
+        identity = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size, options)
+        return hashlib.sha256(repr(identity).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def content_key(content, *options):
+        """
+        Returns the key of the data string of an image with given content
+        (bytes) encoded with given options.
+        """
+        sha256 = hashlib.sha256(content)
+        sha256.update(repr(options).encode('utf-8'))
+        return sha256.hexdigest()
+
+    def _read(self, name):
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, encoding='ascii') as fh:
+                value = fh.read()
+            # mark the file as recently used
+            os.utime(path)
+        except FileNotFoundError:  # missing or evicted by another process in the meantime
+            return None
+        return value
+
+    def _write(self, name, value):
+        # write to a temporary file first so that other processes never read a partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='ascii') as fh:
+            fh.write(value)
+        os.replace(temp_path, os.path.join(self.directory, name))
+        self.size += len(value)
+        if self.size > self.max_size:
+            self.evict()
+
+    def get(self, key):
+        """
+        Returns the data string of given key (see `key`) or None.
+        """
+        content_key = self._read(key + self.index_suffix)
+        return None if content_key is None else self.get_content(content_key)
+
+    def get_content(self, content_key):
+        """
+        Returns the data string of given content key (see `content_key`) or None.
+        """
+        return self._read(content_key)
+
+    def set(self, key, content_key, value=None):
+        """
+        Makes `key` point to the entry `content_key` and writes the data
+        string `value` to this entry (None if the entry already exists).
+        """
+        if value is not None:
+            self._write(content_key, value)
+        self._write(key + self.index_suffix, content_key)
+
+    def _entries(self):
+        # (modification time, size, path) of the entries of the cache
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self.size = total_size
+
+def is_local_path(src):
     src_lower = src.lower()
-    is_path = src and not ('http' in src_lower or 'www' in src_lower)
-    if is_path:
-        logger.info(f'Getting data string for "{src}"')
-        media_type = os.path.splitext(src_lower)[-1].lstrip('.').replace('jpg', 'jpeg').replace('svg', 'svg+xml')
+    return bool(src) and not ('http' in src_lower or 'www' in src_lower or src_lower.startswith('data:'))
+
+def recompress_image(content, media_type, options):
+    """
+    Re-encodes an image with Pillow: strips its metadata, downsizes it to
+    `options.max_width` (if given) and saves it as `options.format` (or
+    in its original format if not given).
+
+    Returns a tuple (content, media type). The original image is returned
+    if it cannot be recompressed (SVG, animations) or if the result is not
+    smaller.
+    """
+    try:
+        from PIL import Image
+    except (ModuleNotFoundError, ImportError) as e:
+        raise ModuleNotFoundError('Optional dependency `Pillow` needs to be installed for recompressing images') from e
+
+    if media_type == 'svg+xml':
+        return content, media_type
+    with Image.open(io.BytesIO(content)) as image:
+        if getattr(image, 'is_animated', False):
+            return content, media_type
+        image.load()
+        new_media_type = options.format or image.format.lower()
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        if new_media_type == 'jpeg' and has_alpha:  # JPEG has no transparency
+            new_media_type = 'png'
+        # palette images keep their transparent color(s) in `image.info`, other images with a
+        # transparent color (or a palette with alpha) get an alpha channel so that resizing blends it
+        if has_alpha and image.mode not in ('RGBA', 'LA', 'P'):
+            image = image.convert('LA' if image.mode in ('L', 'I', 'I;16') else 'RGBA')
+        if options.max_width and image.width > options.max_width:
+            height = max(1, round(image.height * options.max_width / image.width))
+            image = image.resize((options.max_width, height), Image.LANCZOS)
+        if new_media_type == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        # Pillow writes the metadata it finds in `image.info` (e.g. EXIF, ICC profile, PNG text chunks)
+        # so we clear it, except for the transparency which is part of the image
+        image.info = {key: value for key, value in image.info.items() if key == 'transparency'}
+        save_kwargs = {'webp': {'quality': options.quality, 'method': 6},
+                       'jpeg': {'quality': options.quality, 'optimize': True, 'progressive': True},
+                       'png': {'optimize': True}}.get(new_media_type, {})
+        output = io.BytesIO()
+        image.save(output, format=new_media_type.upper(), **save_kwargs)
+    new_content = output.getvalue()
+    if len(new_content) >= len(content):
+        return content, media_type
+    return new_content, new_media_type
+
+def _iter_base64(image_file, size):
+    """
+    Yields the base64 encoding of an image file by chunks, reading from a
+    memory map of the file so that it is never fully loaded in memory.
+    """
+    with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            for start in range(0, size, _base64_chunk_size):
+                yield base64.b64encode(view[start:start + _base64_chunk_size]).decode('ascii')
+        finally:
+            view.release()
+
+def _media_type(src):
+    # e.g. "png" for "logo.PNG", "jpeg" for "photo.jpg"
+    return os.path.splitext(src.lower())[-1].lstrip('.').replace('jpg', 'jpeg').replace('svg', 'svg+xml')
+
+def _hash_file(path):
+    # SHA-256 of a file read by chunks
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(_base64_chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
-        # keep the default FileNotFoundError if the file does note exist that's OK
-        with open(src, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read())
+def write_data_string(src, out, base_dir=None, disk_cache=None, recompress=None):
+    """
+    Writes the data string of an image at path `src` (relative to
+    `base_dir` if given) to the file object `out` and returns True, or
+    returns False if `src` is not a local path. `disk_cache` is an
+    optional `DiskCache` and `recompress` optional `RecompressOptions`
+    (see `recompress_image`).
+
+    Large images that are not recompressed nor cached on disk are
+    streamed to `out` by chunks instead of being loaded in memory.
+    """
+    if not is_local_path(src):
+        return False
+    media_type = _media_type(src)
+
+    # relative paths in an HTML file are relative to the HTML file itself
+    path = os.path.join(base_dir, src) if base_dir is not None else src
+
+    # keep the default FileNotFoundError if the file does note exist that's OK
+    stat = os.stat(path)
+    memo_key = (os.path.realpath(path), stat.st_mtime_ns, stat.st_size, recompress)
+    data_string = _data_strings_memo.get(memo_key)
+    if data_string is not None:
+        logger.info(f'Getting data string for "{src}" (cached)')
+        out.write(data_string)
+        return True
+
+    logger.info(f'Getting data string for "{src}"')
+    # images whose data string would not be memoized are streamed (base64 takes 4 characters per 3 bytes)
+    if stat.st_size // 3 * 4 > _memo_max_size and disk_cache is None and recompress is None:
+        out.write(f"data:image/{media_type};charset=utf-8;base64,")
+        with open(path, "rb") as image_file:
+            for chunk in _iter_base64(image_file, stat.st_size):
+                out.write(chunk)
+        return True
+
+    data_string = None
+    if disk_cache is not None:
+        cache_key = disk_cache.key(path, stat, media_type, recompress)
+        data_string = disk_cache.get(cache_key)
+    if data_string is None:
+        with open(path, "rb") as image_file:
+            content = image_file.read()
+        if disk_cache is not None:
+            # the image may be a copy of an image that is already in the cache
+            content_key = disk_cache.content_key(content, media_type, recompress)
+            data_string = disk_cache.get_content(content_key)
+            if data_string is not None:
+                disk_cache.set(cache_key, content_key)
+    if data_string is None:
+        if recompress is not None:
+            original_size = len(content)
+            content, media_type = recompress_image(content, media_type, recompress)
+            logger.info(f'Recompressed "{src}": {original_size} -> {len(content)} bytes '
+                        f'({original_size - len(content)} bytes saved)')
 
         # convert to bytes in the HTML code
+        encoded_string = base64.b64encode(content)
+        del content
         data_string = f"data:image/{media_type};charset=utf-8;base64,"+encoded_string.decode('utf-8')
-        return data_string
-    else:
+        if disk_cache is not None:
+            disk_cache.set(cache_key, content_key, data_string)
+
+    # the size of the file does not matter, a large image may be recompressed to a small data string
+    if len(data_string) <= _memo_max_size:
+        _data_strings_memo[memo_key] = data_string
+    out.write(data_string)
+    return True
+
+def get_data_string(src, base_dir=None, disk_cache=None, recompress=None):
+    """
+    Returns the data string of an image at path `src` or None if `src`
+    is not a local path (see `write_data_string` for the parameters).
+    """
+    out = io.StringIO()
+    if not write_data_string(src, out, base_dir=base_dir, disk_cache=disk_cache, recompress=recompress):
         return None
+    return out.getvalue()
 
-def is_image_tag(tag):
-    if tag.name == 'img':
+def is_image(name, attrs):
+    if name == 'img':
         return True
-    elif tag.name == 'link':
-        type_ = getattr(tag, 'type', '')
+    elif name == 'link':
+        type_ = attrs.get('type', '')
         return isinstance(type_, str) and type_.startswith('image')
     else:
         return False
 
+def is_image_tag(tag):
+    return is_image(tag.name, tag.attrs)
+
+def _attribute_value(match):
+    # attributes without a value e.g. <img hidden> are empty strings (same as with BeautifulSoup)
+    value = next((v for v in match.groups()[1:] if v is not None), '')
+    return html.unescape(value)
+
+def _parse_image_tag(tag):
+    """
+    Returns the name, the attributes and the attribute matches of a tag matched
+    with `_image_tag_regex` or `_stream_tag_regex`.
+    """
+    name = tag.group(1).lower()
+    attribute_matches = list(_attribute_regex.finditer(tag.group(2)))
+    attrs = {match.group(1).lower(): _attribute_value(match) for match in attribute_matches}
+    return name, attrs, attribute_matches
+
+def _has_local_image(tag):
+    name, attrs, _ = _parse_image_tag(tag)
+    return is_image(name, attrs) and (is_local_path(attrs.get('src', '')) or is_local_path(attrs.get('href', '')))
+
+def scan_html_file(html_file):
+    """
+    Streams the raw bytes of an HTML file without parsing it and returns
+    a tuple (SHA-256 of the file, whether it references local images).
+    Tags are matched with regexes so this may give false positives
+    (e.g. an <img> tag in a comment) but never false negatives: an
+    image tag that is not closed within `_max_tag_size` characters is
+    assumed to reference a local image.
+    """
+    sha256 = hashlib.sha256()
+    has_local_image = False
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    with open(html_file, 'rb') as fh:
+        for chunk in iter(partial(fh.read, _chunk_size), b''):
+            sha256.update(chunk)
+            if has_local_image:
+                continue
+            buffer += decoder.decode(chunk)
+            end = 0
+            for tag in _image_tag_regex.finditer(buffer):
+                end = tag.end()
+                if _has_local_image(tag):
+                    has_local_image = True
+                    break
+            # keep an incomplete tag (or the beginning of one) for the next chunk
+            incomplete_tag = _image_tag_start_regex.search(buffer, end)
+            buffer = buffer[incomplete_tag.start():] if incomplete_tag else buffer[-5:]
+            if len(buffer) > _max_tag_size:
+                has_local_image = True
+    return sha256.hexdigest(), has_local_image
+
+def _write_dedup_script(out, images, write_image):
+    """
+    Writes the script providing the deduplicated `images` (in the order of
+    their ids), `write_image(image)` writing the data string of an image.
+    """
+    out.write(_dedup_script_start)
+    for ix, image in enumerate(images):
+        out.write(f'{"," if ix else ""}\n"')
+        write_image(image)
+        out.write('"')
+    out.write(_dedup_script_end)
+
+def embed_images_soup(html_file, out, favicon_path=None, page_title=None, threads=None, disk_cache=None,
+                      dedup=False, recompress=None):
+    """
+    Writes the HTML file to the file object `out` with embedded images
+    using BeautifulSoup. Images are read and encoded in a pool of
+    `threads` threads. See `ImageEmbedder` for `dedup`.
+
+    When recompressing images (CPU bound), a pool of processes is used
+    instead unless we already are in a worker process (batch mode).
+    """
+    # parse HTML file
+    with open(html_file, encoding='utf-8') as fh:
+        soup = BeautifulSoup(fh, features='html.parser')
+
+    # get all images
+    imgs = soup.findAll(is_image_tag)
+
+    # read and encode every distinct image once, concurrently (this is mostly I/O
+    # and base64 encoding which both release the GIL)
+    srcs = {img.get(attr, '') for img in imgs for attr in ('src', 'href')}
+    base_dir = os.path.dirname(os.path.abspath(html_file))
+    get_data_string_ = partial(get_data_string, base_dir=base_dir, disk_cache=disk_cache, recompress=recompress)
+    in_worker_process = multiprocessing.parent_process() is not None
+    pool_class = ProcessPoolExecutor if recompress is not None and not in_worker_process else ThreadPoolExecutor
+    with pool_class(max_workers=threads) as executor:
+        data_strings = dict(zip(srcs, executor.map(get_data_string_, srcs)))
+
+    # only the images referenced several times are deduplicated, the others stay inline
+    references = Counter(data_strings[img.get(attr, '')] for img in imgs for attr in ('src', 'href'))
+
+    # embed images by putting bytes into the HTML code
+    dedup_ids = {}
+    for img in imgs:
+        # check src and href attr
+        for attr in ('src', 'href'):
+            data_string = data_strings[img.get(attr, '')]
+            if data_string and dedup and references[data_string] > 1:
+                img[f'data-embedded-{attr}'] = str(dedup_ids.setdefault(data_string, len(dedup_ids)))
+                del img[attr]
+            elif data_string:
+                img[attr] = data_string
+
+    # add favicon
+    if favicon_path:
+        favicon_data_string = get_data_string(favicon_path, disk_cache=disk_cache, recompress=recompress)
+        new_tag = soup.new_tag('link', rel='icon', type='image/png', href=favicon_data_string, sizes='32*32')
+        soup.head.insert(0, new_tag)
+
+    # add title
+    if page_title:
+        new_title = soup.new_tag('title')
+        new_title.insert(0, NavigableString(page_title))
+        soup.title.replace_with(new_title)
+
+    if not dedup_ids:
+        out.write(str(soup))
+        return
+
+    # the script needs to be at the end of the body so that all images exist when it runs,
+    # we write it ourselves rather than adding it to the soup to avoid a copy of all the images
+    placeholder = soup.new_tag('script', id='embedded-images-placeholder')
+    (soup.body or soup).append(placeholder)
+    before, after = str(soup).split(str(placeholder))
+    out.write(before)
+    _write_dedup_script(out, dedup_ids, out.write)
+    out.write(after)
+
+def _local_image_sources(tag):
+    """
+    Yields the attribute matches with a local path (src/href) of a tag
+    matched with `_stream_tag_regex` if it is an image tag.
+    """
+    name, attrs, attribute_matches = _parse_image_tag(tag)
+    if not is_image(name, attrs):
+        return
+    for match in attribute_matches:
+        if match.group(1).lower() in ('src', 'href') and is_local_path(_attribute_value(match)):
+            yield match
+
+def _embed_image_tag(tag, out, base_dir, disk_cache, dedup_ids=None, recompress=None):
+    """
+    Writes the text of a tag matched with `_stream_tag_regex` with embedded
+    images to `out`. Only the values of the src/href attributes are changed.
+
+    The attributes of the images in `dedup_ids` ({real path: (id, src)}) are
+    replaced by references to deduplicated images instead (see `ImageEmbedder`).
+    """
+    text = tag.group(0)
+    last_end = 0
+    offset = tag.start(2) - tag.start(0)
+    for match in _local_image_sources(tag):
+        attr = match.group(1).lower()
+        src = _attribute_value(match)
+        out.write(text[last_end:offset + match.start()])
+        last_end = offset + match.end()
+        dedup_id = (dedup_ids or {}).get(os.path.realpath(os.path.join(base_dir, src)))
+        if dedup_id is not None:
+            out.write(f'data-embedded-{attr}="{dedup_id[0]}"')
+        else:
+            out.write(f'{match.group(1)}="')
+            write_data_string(src, out, base_dir=base_dir, disk_cache=disk_cache, recompress=recompress)
+            out.write('"')
+    out.write(text[last_end:])
+
+def _iter_html_tokens(html_file):
+    """
+    Reads an HTML file chunk by chunk and tokenizes it with regexes
+    without building a tree of the document. Yields tuples (kind, value):
+
+    * ("text", text) for text that does not matter to us (including comments)
+    * ("tag", match) for the start tags matched with `_stream_tag_regex`
+    * ("raw_text", text) for the content of <script>, <style> and <title>
+      elements (like an HTML parser, we do not look for tags in there)
+    * ("end_tag", match) for </body> and </html>
+
+    Memory usage is bounded by the chunk size and `_max_tag_size`: when a
+    tag is still not closed after `_max_tag_size` characters (e.g. a quote
+    that is never closed), the buffered text is yielded as text.
+    """
+    in_comment = False
+    raw_text_element = None  # element whose content is raw text e.g. "script"
+    buffer = ''
+    eof = False
+    with open(html_file, encoding='utf-8', newline='') as fh:
+        while not eof:
+            chunk = fh.read(_chunk_size)
+            eof = not chunk
+            buffer += chunk
+            pos = 0
+            while pos < len(buffer):
+                if in_comment:
+                    end = buffer.find('-->', pos)
+                    if end == -1:
+                        # keep what may be the beginning of "-->" for the next chunk
+                        safe_end = len(buffer) if eof else max(pos, len(buffer) - 2)
+                        yield 'text', buffer[pos:safe_end]
+                        pos = safe_end
+                        break
+                    yield 'text', buffer[pos:end + 3]
+                    pos = end + 3
+                    in_comment = False
+                elif raw_text_element:
+                    match = _raw_text_end_regexes[raw_text_element].search(buffer, pos)
+                    end = match.start() if match else len(buffer)
+                    if match is None and not eof:
+                        # keep what may be the beginning of the end tag for the next chunk
+                        end = max(pos, len(buffer) - len(raw_text_element) - 2)
+                    yield 'raw_text', buffer[pos:end]
+                    pos = end
+                    if match is None:
+                        break
+                    # the end tag itself is normal text
+                    raw_text_element = None
+                else:
+                    match = _stream_token_regex.search(buffer, pos)
+                    if match is None:
+                        # keep what may be the beginning of a token for the next chunk
+                        safe_end = len(buffer)
+                        if not eof:
+                            last_tag_start = buffer.rfind('<', max(pos, len(buffer) - 7))
+                            safe_end = last_tag_start if last_tag_start != -1 else safe_end
+                        yield 'text', buffer[pos:safe_end]
+                        pos = safe_end
+                        break
+                    yield 'text', buffer[pos:match.start()]
+                    pos = match.start()
+                    if match.group() == '<!--':
+                        yield 'text', '<!--'
+                        pos += 4
+                        in_comment = True
+                        continue
+
+                    is_end_tag = match.group().startswith('</')
+                    tag = (_stream_end_tag_regex if is_end_tag else _stream_tag_regex).match(buffer, pos)
+                    if tag is None:
+                        # not a valid tag or one that does not end, copy everything that is left
+                        if eof or len(buffer) - pos > _max_tag_size:
+                            yield 'text', buffer[pos:]
+                            pos = len(buffer)
+                        # else the tag is incomplete, wait for the next chunk
+                        break
+                    pos = tag.end()
+                    yield ('end_tag' if is_end_tag else 'tag'), tag
+                    name = tag.group(1).lower()
+                    if name in _raw_text_end_regexes:
+                        raw_text_element = name
+            buffer = buffer[pos:]
+
+def embed_images_streaming(html_file, out, favicon_path=None, page_title=None, disk_cache=None, dedup=False,
+                           recompress=None):
+    """
+    Writes the HTML file to the file object `out` with embedded images
+    without building a tree of the document (see `_iter_html_tokens`).
+
+    Only the image tags (same rules as `is_image_tag`) are rewritten,
+    everything else is copied as is. Images are streamed to `out` (see
+    `write_data_string`).
+
+    With `dedup` (see `ImageEmbedder`), the document is tokenized twice:
+    once for finding the images referenced several times (by content
+    hash) and once for writing it. The script providing these images is
+    written at the end of the body.
+    """
+    base_dir = os.path.dirname(os.path.abspath(html_file))
+    favicon_tag = None
+    if favicon_path:
+        favicon_data_string = get_data_string(favicon_path, disk_cache=disk_cache, recompress=recompress)
+        favicon_tag = f'<link href="{favicon_data_string}" rel="icon" sizes="32*32" type="image/png"/>'
+
+    # {real path: (id, src)} of the images whose content is referenced several times
+    # (like the soup engine, copies of an image at different paths are written once)
+    dedup_ids = None
+    shared_srcs = []
+    if dedup:
+        content_keys = {}  # {real path: content key}
+        references = {}  # {content key: [src, number of references]}
+        for kind, tag in _iter_html_tokens(html_file):
+            if kind == 'tag':
+                for match in _local_image_sources(tag):
+                    src = _attribute_value(match)
+                    path = os.path.realpath(os.path.join(base_dir, src))
+                    if path not in content_keys:
+                        content_keys[path] = (_media_type(src), _hash_file(path))
+                    references.setdefault(content_keys[path], [src, 0])[1] += 1
+        ids = {}
+        for key, (src, count) in references.items():
+            if count > 1:
+                ids[key] = len(shared_srcs)
+                shared_srcs.append(src)
+        dedup_ids = {path: (ids[key], references[key][0]) for path, key in content_keys.items() if key in ids}
+
+    def write_dedup_script():
+        write_image = partial(write_data_string, out=out, base_dir=base_dir, disk_cache=disk_cache,
+                              recompress=recompress)
+        _write_dedup_script(out, shared_srcs, write_image)
+
+    skip_raw_text = False  # whether we drop the raw text of an element (title being replaced)
+    title_replaced = False
+    for kind, value in _iter_html_tokens(html_file):
+        if kind == 'raw_text':
+            if not skip_raw_text:
+                out.write(value)
+            continue
+        skip_raw_text = False
+        if kind == 'text':
+            out.write(value)
+        elif kind == 'end_tag':
+            # the script needs to be at the end of the body so that all images exist when it runs
+            if dedup_ids:
+                write_dedup_script()
+                # images after the script are embedded as usual
+                dedup_ids = None
+            out.write(value.group(0))
+        else:
+            name = value.group(1).lower()
+            if name in ('img', 'link'):
+                _embed_image_tag(value, out, base_dir=base_dir, disk_cache=disk_cache, dedup_ids=dedup_ids,
+                                 recompress=recompress)
+                continue
+            out.write(value.group(0))
+            if name == 'head' and favicon_tag:
+                out.write(favicon_tag)
+                favicon_tag = None
+            elif name == 'title' and page_title and not title_replaced:
+                out.write(html.escape(page_title, quote=False))
+                skip_raw_text = True
+                title_replaced = True
+
+    # no </body> nor </html>
+    if dedup_ids:
+        write_dedup_script()
+
+class _HashingWriter:
+    """
+    Writes text to a binary file object as UTF-8 and keeps track of
+    the hash and the number of bytes written.
+    """
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha256 = hashlib.sha256()
+        self.nb_bytes = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.sha256.update(data)
+        self.nb_bytes += len(data)
+        self.fh.write(data)
+
+def embed_images_in_file(html_file, favicon_path=None, page_title=None, threads=None, disk_cache=None,
+                         skip_sha256=None, engine='soup', dedup=False, recompress=None):
+    """
+    Embeds the local images of an HTML file and overwrites it
+    (see `ImageEmbedder`) using given `engine` ("soup" for
+    `embed_images_soup` or "stream" for `embed_images_streaming`).
+    `disk_cache` is an optional `DiskCache` and `recompress` optional
+    `RecompressOptions`. See `ImageEmbedder` for `dedup`.
+
+    The file is left untouched if its hash is `skip_sha256` (e.g. it
+    was already processed in a previous run) or if there is nothing to
+    do (no local image, no favicon and no title to set).
+
+    Returns an `EmbedResult`.
+    """
+    start = time.perf_counter()
+
+    logger.info(f'Opening the file "{html_file}"')
+    if not os.path.isfile(html_file):
+        raise FileNotFoundError(f'No file found at path "{html_file}"')
+
+    # pre-scan the raw bytes so that we can skip the (costly) parsing
+    sha256, has_local_image = scan_html_file(html_file)
+    if sha256 == skip_sha256:
+        logger.info(f'Skipping the file "{html_file}" (unchanged since the last run)')
+        return EmbedResult(html_file, 0, time.perf_counter() - start, sha256, True)
+    if not (has_local_image or favicon_path or page_title):
+        logger.info(f'Skipping the file "{html_file}" (no local image to embed)')
+        return EmbedResult(html_file, 0, time.perf_counter() - start, sha256, True)
+
+    # write the modified HTML code to a temporary file first and then replace the original
+    # file with it, this way the original file is never left half written
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(html_file)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            out = _HashingWriter(fh)
+            if engine == 'stream':
+                embed_images_streaming(html_file, out, favicon_path=favicon_path, page_title=page_title,
+                                       disk_cache=disk_cache, dedup=dedup, recompress=recompress)
+            else:
+                embed_images_soup(html_file, out, favicon_path=favicon_path, page_title=page_title,
+                                  threads=threads, disk_cache=disk_cache, dedup=dedup, recompress=recompress)
+        shutil.copymode(html_file, temp_path)
+        logger.info(f'Overwriting the file "{html_file}"')
+        os.replace(temp_path, html_file)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return EmbedResult(html_file, out.nb_bytes, time.perf_counter() - start, out.sha256.hexdigest(), False)
+
+def find_html_files(html_file, pattern='**/*.html'):
+    """
+    Returns the HTML files to process for a path given to `ImageEmbedder`:
+    a single file, a directory (searched with `pattern`) or a glob pattern.
+    """
+    if os.path.isdir(html_file):
+        return sorted(glob.glob(os.path.join(html_file, pattern), recursive=True))
+    elif glob.has_magic(html_file):
+        return sorted(glob.glob(html_file, recursive=True))
+    else:
+        return [html_file]
+
+def load_manifest(path):
+    """
+    Loads a manifest of processed HTML files {absolute path: {"sha256": ..., "options": ...}}.
+    """
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+def save_manifest(manifest, path):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+
 
 # -
 
@@ -49,6 +802,37 @@ class ImageEmbedder(cli.Application):
     The original HTML file will be **overwritten** with embedded
     images.
 
+    Encoded images are memoized within a process and, if a cache
+    directory is given, in a cache on disk (keyed by the path, the
+    modification time and the size of the images) so that images
+    shared by many HTML files (e.g. logos) are encoded once.
+
+    HTML files without local images are detected with a quick scan of
+    their raw bytes and left untouched. With a manifest, HTML files that
+    did not change since they were last processed are skipped as well.
+
+    The default engine parses the whole document with BeautifulSoup.
+    For large HTML files, the "stream" engine only tokenizes the document
+    chunk by chunk and rewrites the image tags, keeping memory bounded.
+
+    With --dedup, each image referenced several times is written only
+    once in a script at the end of the body and the image tags refer to
+    it (e.g. <img data-embedded-src="0">). Images referenced once stay
+    inline. The script decodes each image once
+    and gives its object URL to all the tags referencing it. This cuts
+    the size of HTML files repeating logos or backgrounds but requires
+    JavaScript to display the images.
+
+    With --recompress, images are re-encoded with Pillow before being
+    embedded: metadata are stripped, images wider than --max-width are
+    downsized and they are saved in the given format (unless this does
+    not make them smaller). The bytes saved are reported for each image.
+
+    Instead of a single file, a directory or a glob pattern can be
+    given (batch mode). The HTML files are then processed in a pool
+    of processes and timings as well as the total throughput are
+    reported at the end.
+
     ToDo: since this script is doing more than just embedding images
     now might as well create a command that also export slides from
     a notebook.
@@ -56,48 +840,86 @@ class ImageEmbedder(cli.Application):
     Parameters
     ----------
     html_file : str
-        Path to an HTML file
+        Path to an HTML file, a directory or a glob pattern
 
     Examples
     --------
     $ python embed_images.py test.html
+    $ python embed_images.py --jobs 8 "2021/**/*.slides.html"
+    $ python embed_images.py --cache-dir .embed_cache 2021/
+    $ python embed_images.py --manifest .embed_manifest.json 2021/ favicon.png "My title"
+    $ python embed_images.py --engine stream huge.slides.html
+    $ python embed_images.py --dedup test.html
+    $ python embed_images.py --recompress webp --max-width 1280 test.html
     """
+    jobs = cli.SwitchAttr(['j', 'jobs'], int, default=os.cpu_count() or 1,
+                          help='Number of processes for embedding HTML files in batch mode')
+    threads = cli.SwitchAttr(['t', 'threads'], int, default=8,
+                             help='Number of threads for reading and encoding the images of an HTML file')
+    pattern = cli.SwitchAttr(['p', 'pattern'], str, default='**/*.html',
+                             help='Pattern for finding HTML files when a directory is given')
+    cache_dir = cli.SwitchAttr(['cache-dir'], str, default=None,
+                               help='Directory of a cache of encoded images shared across runs')
+    cache_size = cli.SwitchAttr(['cache-size'], int, default=512,
+                                help='Maximum size of the cache directory in MB')
+    engine = cli.SwitchAttr(['e', 'engine'], cli.Set('soup', 'stream'), default='soup',
+                            help='"soup" parses the whole document, "stream" rewrites image tags chunk by chunk')
+    dedup = cli.Flag(['dedup'], help='Write images referenced several times once in a script the image tags refer to')
+    recompress = cli.SwitchAttr(['recompress'], cli.Set('same', 'webp', 'png', 'jpeg'), default=None,
+                                help='Re-encode images to this format ("same" keeps their format) before embedding them')
+    max_width = cli.SwitchAttr(['max-width'], int, default=None, requires=['recompress'],
+                               help='Maximum width of recompressed images in pixels')
+    quality = cli.SwitchAttr(['quality'], int, default=80, requires=['recompress'],
+                             help='Quality of recompressed WebP/JPEG images (0-100)')
+    manifest = cli.SwitchAttr(['manifest'], str, default=None,
+                              help='JSON file recording the hashes of processed HTML files for skipping them next time')
+
     def main(self, html_file, favicon_path=None, page_title=None):
+        html_files = find_html_files(html_file, pattern=self.pattern)
+        if not html_files:
+            raise FileNotFoundError(f'No HTML file found for "{html_file}"')
+        disk_cache = DiskCache(self.cache_dir, max_size=self.cache_size * 2**20) if self.cache_dir else None
+        recompress = None
+        if self.recompress:
+            recompress = RecompressOptions(format=None if self.recompress == 'same' else self.recompress,
+                                           max_width=self.max_width, quality=self.quality)
+        embed = partial(embed_images_in_file, favicon_path=favicon_path, page_title=page_title,
+                        threads=self.threads, disk_cache=disk_cache, engine=self.engine, dedup=self.dedup,
+                        recompress=recompress)
+
+        # files processed with the same options in a previous run can be skipped if they did not change
+        manifest = load_manifest(self.manifest) if self.manifest else {}
+        # everything affecting the output of `embed_images_in_file`
+        options = {'favicon_path': favicon_path, 'page_title': page_title, 'engine': self.engine,
+                   'dedup': self.dedup, 'recompress': recompress._asdict() if recompress else None}
+        skip_hashes = {}
+        for f in html_files:
+            entry = manifest.get(os.path.abspath(f))
+            if entry is not None and entry['options'] == options:
+                skip_hashes[f] = entry['sha256']
+
+        start = time.perf_counter()
+        if len(html_files) == 1 or self.jobs <= 1:
+            results = [embed(f, skip_sha256=skip_hashes.get(f)) for f in html_files]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.jobs, len(html_files))) as executor:
+                futures = [executor.submit(embed, f, skip_sha256=skip_hashes.get(f)) for f in html_files]
+                results = [future.result() for future in as_completed(futures)]
+        duration = time.perf_counter() - start
+
+        if self.manifest:
+            for result in results:
+                manifest[os.path.abspath(result.html_file)] = {'sha256': result.sha256, 'options': options}
+            save_manifest(manifest, self.manifest)
+
+        # report timings
+        for result in sorted(results):
+            if not result.skipped:
+                logger.info(f'"{result.html_file}": {result.nb_bytes / 1e6:.2f} MB in {result.duration:.2f}s')
+        total_mb = sum(result.nb_bytes for result in results) / 1e6
+        nb_skipped = sum(result.skipped for result in results)
+        logger.info(f'Embedded images in {len(results) - nb_skipped} file(s) ({nb_skipped} skipped): '
+                    f'{total_mb:.2f} MB in {duration:.2f}s ({total_mb / duration:.2f} MB/s)')
 
-        # parse HTML file
-        logger.info(f'Opening the file "{html_file}"')
-        if not os.path.isfile(html_file):
-            raise FileNotFoundError(f'No file found at path "{html_file}"')
-        soup = BeautifulSoup(open(html_file, encoding='utf-8'), features='html.parser')
-
-        # get all images
-        imgs = soup.findAll(is_image_tag)
-
-        # embed images by putting bytes into the HTML code
-        for img in imgs:
-            # check src and href attr
-            for attr in ('src', 'href'):
-                attr_val = img.get(attr, '')
-                data_string = get_data_string(attr_val)
-                if data_string:
-                    img[attr] = data_string
-
-        # add favicon
-        if favicon_path:
-            favicon_data_string = get_data_string(favicon_path)
-            new_tag = soup.new_tag('link', rel='icon', type='image/png', href=favicon_data_string, sizes='32*32')
-            soup.head.insert(0, new_tag)
-
-        # add title
-        if page_title:
-            new_title = soup.new_tag('title')
-            new_title.insert(0, NavigableString(page_title))
-            soup.title.replace_with(new_title)
-
-        # save modified HTML code
-        logger.info(f'Overwriting the file "{html_file}"')
-        with open(html_file, "w", encoding='utf-8') as file:
-            file.write(str(soup))
-        
 if __name__ == "__main__":
     ImageEmbedder.run()